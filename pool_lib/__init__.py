@@ -7,20 +7,28 @@
 # Free Software Foundation; either version 3 of the License, or (at your
 # option) any later version.
 
+import bisect
 import errno
+import fcntl
+import hashlib
 import importlib
+import json
 import logging
 import os
 import re
 import shlex
 import shutil
+import stat
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 from builtins import list as List
 from collections.abc import Callable, Generator, Iterable, Iterator
-from contextlib import contextmanager
-from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import AbstractContextManager, ExitStack, contextmanager
+from fnmatch import translate
 from os.path import (
     abspath,
     basename,
@@ -34,14 +42,23 @@ from os.path import (
     relpath,
     splitext,
 )
-from typing import Self, TypeVar, cast, no_type_check
+from types import TracebackType
+from typing import (
+    Any,
+    NamedTuple,
+    Self,
+    TextIO,
+    TypeVar,
+    cast,
+    no_type_check,
+)
 
 import verseek_lib as verseek
-from debian import debfile, debian_support
+from debian import debfile
 from gitwrapper import Git, GitError
-from packaging.version import Version
 
 from .forked import forked_constructor
+from .gitsession import GitSessionError, GitSessions
 
 logger = logging.getLogger("pool")
 # allow 'DEBUG' env var to override 'POOL_LOG_LEVEL'
@@ -68,6 +85,8 @@ logging.basicConfig(
 )
 
 AnyPath = str | os.PathLike
+# (device, inode, size, mtime) of a file
+ControlKey = tuple[int, int, int, int]
 
 
 def str_path(p: AnyPath) -> str:
@@ -110,6 +129,75 @@ def parse_package_filename(filename: str) -> tuple[str, str]:
     return name, version
 
 
+# Debian version sort keys. Comparing two keys gives the same result as
+# comparing the versions with dpkg --compare-versions.
+#
+# A version is split into epoch, upstream version and revision. Each of the
+# latter two is split into alternating non-digit and digit parts, and each
+# part becomes a (characters, number) pair. Characters are mapped so that
+# '~' sorts before the end of a string, which sorts before letters, which
+# sort before everything else. The pair list ends with a sentinel standing
+# for "nothing left", so that 1.0~rc1 < 1.0 < 1.0.1.
+
+VersionPart = tuple[tuple[int, ...], int]
+VersionKey = tuple[int, tuple[VersionPart, ...], tuple[VersionPart, ...]]
+
+_VERSION_RE = re.compile(
+    r"^(?:(?P<epoch>\d+):)?"
+    r"(?P<upstream>[A-Za-z0-9.+:~-]+?)"
+    r"(?:-(?P<revision>[A-Za-z0-9+.~]+))?$"
+)
+_VERSION_PART_RE = re.compile(r"(\D*)(\d*)")
+_VERSION_PART_END: VersionPart = ((0,), 0)
+
+# version string -> key; interned so that each key is computed only once
+_version_keys: dict[str, VersionKey] = {}
+
+
+def _version_char_order(c: str) -> int:
+    if c == "~":
+        return -1
+    if c.isascii() and c.isalpha():
+        return ord(c)
+    return ord(c) + 256
+
+
+def _version_parts(s: str) -> tuple[VersionPart, ...]:
+    parts = [
+        (tuple(map(_version_char_order, chars)) + (0,), int(digits or 0))
+        for chars, digits in _VERSION_PART_RE.findall(s)
+        if chars or digits
+    ]
+    # trailing parts that compare equal to the end (e.g., the "0" of an
+    # empty revision) mustn't make a version sort after its equal
+    while parts and parts[-1] == _VERSION_PART_END:
+        parts.pop()
+    parts.append(_VERSION_PART_END)
+    return tuple(parts)
+
+
+def version_key(version: str) -> VersionKey:
+    """Return the sort key of Debian version <version>.
+
+    Raises ValueError if <version> isn't a valid Debian version.
+    """
+    try:
+        return _version_keys[version]
+    except KeyError:
+        pass
+
+    m = _VERSION_RE.match(version)
+    if not m or (m.group("epoch") is None and ":" in m.group("upstream")):
+        raise ValueError(f"invalid version `{version}'")
+
+    key = (
+        int(m.group("epoch") or 0),
+        _version_parts(m.group("upstream")),
+        _version_parts(m.group("revision") or ""),
+    )
+    return _version_keys.setdefault(version, key)
+
+
 def read_pkg_deckdebuild_env(filename: str) -> dict[str, str]:
     """Read 'DECKDEBUILD_*' env vars from file.
 
@@ -135,17 +223,161 @@ def read_pkg_deckdebuild_env(filename: str) -> dict[str, str]:
     return deckdebuild_env
 
 
-def hardlink_or_copy(src: AnyPath, dst: AnyPath) -> None:
+# ioctl to share the extents of a file on CoW filesystems (linux/fs.h)
+FICLONE = 0x40049409
+
+# errors that mean a copy strategy isn't supported for a pair of files
+COPY_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EBADF,
+}
+
+
+def _copy_reflink(fd_src: int, fd_dst: int, _: int) -> None:
+    fcntl.ioctl(fd_dst, FICLONE, fd_src)
+
+
+def _copy_file_range(fd_src: int, fd_dst: int, size: int) -> None:
+    copied = 0
+    while copied < size:
+        count = os.copy_file_range(fd_src, fd_dst, size - copied)
+        if not count:
+            break
+        copied += count
+
+
+def _copy_sendfile(fd_src: int, fd_dst: int, size: int) -> None:
+    copied = 0
+    while copied < size:
+        count = os.sendfile(fd_dst, fd_src, copied, size - copied)
+        if not count:
+            break
+        copied += count
+
+
+def _copy_plain(fd_src: int, fd_dst: int, _: int) -> None:
+    with open(fd_src, "rb", closefd=False) as fsrc:
+        with open(fd_dst, "wb", closefd=False) as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+
+
+COPY_STRATEGIES: list[tuple[str, Callable[[int, int, int], None]]] = [
+    ("reflink", _copy_reflink),
+    ("copy_file_range", _copy_file_range),
+    ("sendfile", _copy_sendfile),
+    ("copy", _copy_plain),
+]
+
+# strategies known not to work between two devices: (src_dev, dst_dev, name)
+_copy_unsupported: set[tuple[int, int, str]] = set()
+
+# strategy -> [files, bytes, seconds]; for measuring copy throughput
+copy_stats: dict[str, list[float]] = {}
+
+
+def copy_file(src: AnyPath, dst: AnyPath) -> str:
+    """Copy src to dst using the fastest strategy that works.
+
+    Tries a reflink first, then copy_file_range, then sendfile and falls back
+    to a plain userspace copy. A strategy that copies less than the whole
+    file (e.g., a kernel that reports nothing left to copy early) falls
+    through to the next one. Returns the name of the strategy used.
+    """
+    src = os.fspath(src)
+    dst = os.fspath(dst)
+    try:
+        same = os.path.samefile(src, dst)
+    except FileNotFoundError:
+        same = False
+    if same:
+        # opening dst for writing would truncate src
+        raise PoolError(f"can't copy `{src}' onto itself (`{dst}')")
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fd_src = fsrc.fileno()
+        fd_dst = fdst.fileno()
+        st_src = os.fstat(fd_src)
+        devices = (st_src.st_dev, os.fstat(fd_dst).st_dev)
+
+        for strategy, func in COPY_STRATEGIES:
+            if (*devices, strategy) in _copy_unsupported:
+                continue
+            start = time.monotonic()
+            try:
+                func(fd_src, fd_dst, st_src.st_size)
+            except OSError as e:
+                if e.errno not in COPY_UNSUPPORTED or strategy == "copy":
+                    raise
+                logger.debug(f"copy_file: {strategy} unsupported ({e})")
+                _copy_unsupported.add((*devices, strategy))
+                # undo anything a partial copy left behind
+                os.lseek(fd_src, 0, os.SEEK_SET)
+                os.lseek(fd_dst, 0, os.SEEK_SET)
+                os.ftruncate(fd_dst, 0)
+                continue
+
+            size = os.fstat(fd_dst).st_size
+            if size != st_src.st_size:
+                if strategy == "copy":
+                    raise PoolError(
+                        f"short copy of `{src}' to `{dst}' ({size} of"
+                        f" {st_src.st_size} bytes)"
+                    )
+                logger.debug(
+                    f"copy_file: {strategy} copied {size} of"
+                    f" {st_src.st_size} bytes, falling through"
+                )
+                os.lseek(fd_src, 0, os.SEEK_SET)
+                os.lseek(fd_dst, 0, os.SEEK_SET)
+                os.ftruncate(fd_dst, 0)
+                continue
+
+            elapsed = time.monotonic() - start
+            stats = copy_stats.setdefault(strategy, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += st_src.st_size
+            stats[2] += elapsed
+            logger.debug(
+                f"copy_file({src!r}, {dst!r}): {st_src.st_size} bytes with"
+                f" {strategy} in {elapsed:.3f}s"
+            )
+            return strategy
+
+    raise PoolError(f"no copy strategy worked for `{src}'")
+
+
+def hardlink_or_copy(src: AnyPath, dst: AnyPath) -> str:
+    """Hardlink src to dst, or copy it if they're on different filesystems.
+
+    Returns how the file was delivered: "hardlink" or the copy_file strategy.
+    """
     src = os.fspath(src)
     dst = os.fspath(dst)
     if exists(dst):
+        if os.path.samefile(src, dst):
+            # already delivered - and removing dst could remove src
+            return "hardlink"
         os.remove(dst)
     try:
         os.link(src, dst)
     except OSError as e:
         if e.args[0] != errno.EXDEV:
             raise
-        shutil.copyfile(src, dst)
+        return copy_file(src, dst)
+    return "hardlink"
+
+
+def _path_is_under(path: str, directory: str) -> bool:
+    """Returns True if relative <path> is <directory> or inside it"""
+    return (
+        directory == "."
+        or path == directory
+        or path.startswith(directory + "/")
+    )
 
 
 @contextmanager
@@ -159,8 +391,238 @@ def in_dir(path: AnyPath) -> Generator[None]:
         os.chdir(cwd)
 
 
+class ControlCache:
+    """Persistent cache of deb control fields.
+
+    Entries are keyed by the file's (device, inode, size, mtime) so a deb is
+    only opened again once it has changed. Because the package cache hardlinks
+    binaries where it can, a stock binary and its cached copy usually share
+    an entry.
+    """
+
+    MAGIC = "pool-control-cache"
+    VERSION = 1
+    FIELDS = (
+        "Package",
+        "Version",
+        "Architecture",
+        "Source",
+        "Depends",
+        "Pre-Depends",
+        "Provides",
+    )
+
+    def __init__(self, path: AnyPath | None = None) -> None:
+        self.path = None if path is None else str_path(path)
+        self._entries: dict[ControlKey, dict[str, str]] | None = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def key(path: str) -> ControlKey:
+        st = os.stat(path)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _load(self) -> dict[ControlKey, dict[str, str]]:
+        if self._entries is not None:
+            return self._entries
+
+        with self._lock:
+            if self._entries is not None:
+                return self._entries
+
+            entries: dict[ControlKey, dict[str, str]] = {}
+            if self.path is not None and exists(self.path):
+                with open(self.path) as fob:
+                    header = fob.readline().split()
+                    if header != [self.MAGIC, str(self.VERSION)]:
+                        logger.info(
+                            f"ignoring unknown control cache {self.path}"
+                        )
+                        fob.seek(0, os.SEEK_END)
+                    for line in fob:
+                        try:
+                            dev, ino, size, mtime, fields = json.loads(line)
+                        except ValueError:
+                            # truncated write, will be parsed again
+                            continue
+                        entries[(dev, ino, size, mtime)] = fields
+            self._entries = entries
+        return self._entries
+
+    def _write(self) -> None:
+        assert self.path is not None
+        entries = self._load()
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=dirname(self.path), prefix=".control-cache."
+            )
+            with os.fdopen(fd, "w") as fob:
+                fob.write(f"{self.MAGIC} {self.VERSION}\n")
+                for key, fields in list(entries.items()):
+                    fob.write(json.dumps([*key, fields]) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def _append(self, key: ControlKey, fields: dict[str, str]) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            if not exists(self.path):
+                self._write()
+                return
+            with open(self.path, "a") as fob:
+                fob.write(json.dumps([*key, fields]) + "\n")
+
+    def lookup(self, path: AnyPath) -> dict[str, str] | None:
+        """Return cached control fields of <path> or None on a cache miss"""
+        return self._load().get(self.key(str_path(path)))
+
+    def get(self, path: AnyPath) -> dict[str, str]:
+        """Return control fields of deb at <path>, parsing it on a miss"""
+        path_ = str_path(path)
+        key = self.key(path_)
+        entries = self._load()
+        fields = entries.get(key)
+        if fields is not None:
+            return fields
+
+        control = debfile.DebFile(path_).debcontrol()
+        fields = {
+            field: control[field] for field in self.FIELDS if field in control
+        }
+        entries[key] = fields
+        self._append(key, fields)
+        return fields
+
+    def sha256(self, path: AnyPath) -> str:
+        """Return sha256 hex digest of deb at <path>, hashing it on a miss"""
+        path_ = str_path(path)
+        fields = self.get(path_)
+        if "SHA256" not in fields:
+            with open(path_, "rb") as fob:
+                fields["SHA256"] = hashlib.file_digest(
+                    fob, "sha256"
+                ).hexdigest()
+            self._append(self.key(path_), fields)
+        return fields["SHA256"]
+
+    def prune(self, paths: Iterable[AnyPath]) -> None:
+        """Drop entries that don't belong to any of <paths>"""
+        keep = set()
+        for path in paths:
+            try:
+                keep.add(self.key(str_path(path)))
+            except FileNotFoundError:
+                continue
+
+        entries = self._load()
+        stale = set(entries) - keep
+        if not stale:
+            return
+        for key in stale:
+            del entries[key]
+        if self.path is not None:
+            self._write()
+
+
+class PackageStore:
+    """Content-addressed store of binaries shared between pools.
+
+    Each binary is stored once as <path>/<sha256[:2]>/<sha256>. Pools using
+    the store hardlink their cached binaries to these blobs, so a blob's link
+    count doubles as its reference count: a blob with a single link is no
+    longer used by any pool and may be garbage collected. That's why
+    Pool.get copies (reflinks, where the filesystem can) packages out of
+    store-backed caches rather than hardlinking them - any other hardlink
+    to a cached binary keeps its blob in the store too.
+
+    Hardlinks can't cross filesystems, so the store should live on the same
+    filesystem as the pools' package caches. Otherwise pools fall back to
+    private copies.
+    """
+
+    def __init__(self, path: AnyPath) -> None:
+        self.path = str_path(path)
+        if not isdir(self.path):
+            raise PoolError(f"package store `{self.path}' is not a directory")
+
+    def getpath(self, digest: str) -> str:
+        return join(self.path, digest[:2], digest)
+
+    def add(self, path: AnyPath, digest: str) -> str:
+        """Add binary at <path> with sha256 <digest> -> path to blob"""
+        path_blob = self.getpath(digest)
+        if exists(path_blob):
+            return path_blob
+
+        mkdir(dirname(path_blob))
+        # copy rather than link so that the blob can't change under us if the
+        # original is modified in place
+        fd, path_tmp = tempfile.mkstemp(dir=dirname(path_blob), prefix=".")
+        os.close(fd)
+        try:
+            copy_file(path, path_tmp)
+            os.chmod(path_tmp, 0o444)
+            try:
+                os.link(path_tmp, path_blob)
+            except FileExistsError:
+                # someone else added the same blob concurrently
+                pass
+        finally:
+            os.remove(path_tmp)
+        return path_blob
+
+    def link(self, path: AnyPath, digest: str, dst: AnyPath) -> None:
+        """Add binary at <path> with sha256 <digest> and link its blob to <dst>
+
+        Another pool's gc may remove a blob that add found but we haven't
+        linked yet (it had no other links), in which case we add it again.
+        """
+        while True:
+            path_blob = self.add(path, digest)
+            try:
+                hardlink_or_copy(path_blob, dst)
+                return
+            except FileNotFoundError:
+                if exists(path_blob):
+                    raise
+                logger.debug(f"store: {digest} was collected, adding it again")
+
+    def refcount(self, digest: str) -> int:
+        """Returns how many package cache links the blob has"""
+        try:
+            return os.stat(self.getpath(digest)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def gc(self, verbose: bool = True) -> None:
+        """Remove blobs that aren't linked from any package cache"""
+        for dirent in os.scandir(self.path):
+            if not dirent.is_dir(follow_symlinks=False):
+                continue
+            for blob in os.scandir(dirent.path):
+                if blob.name.startswith("."):
+                    continue
+                if blob.stat(follow_symlinks=False).st_nlink == 1:
+                    if verbose:
+                        print(f"store: removing {blob.name}")
+                    os.remove(blob.path)
+
+
 class PackageCache:
-    """Class representing the pool's package cache"""
+    """Class representing the pool's package cache
+
+    If <path_index> is given, the list of cached binaries is persisted there
+    so that loading a warm cache doesn't need to rescan the cache directory.
+    The index is stamped with the directory's mtime and is only trusted while
+    the stamp matches; add/remove keep it up to date by appending to it.
+
+    If <path_access> is given, accesses to cached binaries are logged there
+    (see touch) so that gc can evict the least recently used binaries.
+    The log is compacted by gc (see compact_access_log).
+    """
+
+    INDEX_MAGIC = "pool-pkgcache-index"
+    INDEX_VERSION = 1
 
     def _list_binaries(self) -> Generator[str]:
         """List binaries in package cache -> list of package filenames"""
@@ -179,29 +641,209 @@ class PackageCache:
         logger.debug(f"PackageCache({self.path})._register({filename})")
         name, version = parse_package_filename(filename)
         self.filenames[(name, version)] = filename
+        self.generation += 1
         if name in self.namerefs:
             self.namerefs[name] += 1
         else:
             self.namerefs[name] = 1
 
+        try:
+            bisect.insort(
+                self.nameversions.setdefault(name, []),
+                version,
+                key=version_key,
+            )
+        except ValueError as e:
+            logger.debug(f"not indexing {name}={version} - {e}")
+
     def _unregister(self, name: str, version: str) -> None:
         logger.debug(
             f"PackageCache({self.path})._unregister({name}, {version})"
         )
         del self.filenames[(name, version)]
+        self.generation += 1
         self.namerefs[name] -= 1
         if not self.namerefs[name]:
             del self.namerefs[name]
 
-    def __init__(self, path: AnyPath) -> None:
-        self.path = str_path(path)
+        versions = self.nameversions.get(name, [])
+        try:
+            i = bisect.bisect_left(
+                versions, version_key(version), key=version_key
+            )
+        except ValueError:
+            return
+        # versions may compare equal without being identical (1.0 vs 1.00)
+        while i < len(versions) and versions[i] != version:
+            i += 1
+        if i < len(versions):
+            del versions[i]
+        if not versions:
+            self.nameversions.pop(name, None)
+
+    def _stamp(self) -> int:
+        return os.stat(self.path).st_mtime_ns
+
+    def _index_header(self, stamp: int) -> str:
+        return f"{self.INDEX_MAGIC} {self.INDEX_VERSION} {stamp:020d}\n"
+
+    def _index_read(self) -> bool:
+        """Load cache contents from the index -> False if it can't be used"""
+        assert self.path_index is not None
+        try:
+            with open(self.path_index) as fob:
+                lines = fob.read().splitlines()
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            logger.warning(f"ignoring corrupt {self.path_index}: {e}")
+            return False
 
-        self.filenames: dict[tuple[str, str], str] = {}
-        self.namerefs: dict[str, int] = {}
+        if not lines:
+            return False
+        header = lines[0].split(" ")
+        if (
+            len(header) != 3
+            or header[0] != self.INDEX_MAGIC
+            or header[1] != str(self.INDEX_VERSION)
+        ):
+            logger.info(f"ignoring unknown pkgcache index {self.path_index}")
+            return False
+
+        stamp = self._stamp()
+        try:
+            if int(header[2]) != stamp:
+                logger.info(f"pkgcache index {self.path_index} is stale")
+                return False
+
+            filenames: dict[tuple[str, str], str] = {}
+            for line in lines[1:]:
+                op, filename = line[:1], line[1:]
+                if op == "+":
+                    filenames[parse_package_filename(filename)] = filename
+                elif op == "-":
+                    filenames.pop(parse_package_filename(filename), None)
+                else:
+                    raise ValueError(f"bad line {line!r}")
+        except (PoolError, ValueError) as e:
+            # e.g., truncated by a crash - the cache directory is the truth
+            logger.warning(f"ignoring corrupt {self.path_index}: {e}")
+            return False
+
+        for filename in filenames.values():
+            self._register(filename)
+        self._index_stamp = stamp
+
+        # compact the index once removals and duplicates pile up
+        if len(lines) > 2 * len(self.filenames) + 64:
+            self._index_write(stamp)
+        return True
+
+    def _index_write(self, stamp: int) -> None:
+        """Atomically rewrite the index from the in-memory state.
+
+        <stamp> is the directory stamp from before the in-memory state was
+        read, so that anything added since makes the index stale.
+        """
+        assert self.path_index is not None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=dirname(self.path_index), prefix=".pkgcache-index."
+            )
+        except PermissionError as e:
+            # a pool we can read but not write is just rescanned every time
+            logger.debug(f"can't write pkgcache index: {e}")
+            self._index_stamp = None
+            return
+        with os.fdopen(fd, "w") as fob:
+            fob.write(self._index_header(stamp))
+            for filename in sorted(self.filenames.values()):
+                fob.write(f"+{filename}\n")
+        os.replace(tmp_path, self.path_index)
+        self._index_stamp = stamp
+
+    def _index_update(self, lines: Iterable[str], stamp_before: int) -> None:
+        """Append <lines> to the index and restamp it.
+
+        <stamp_before> is the directory stamp from before the change we're
+        recording. If it doesn't match the index, something else changed the
+        cache behind our back and we fall back to a rescan.
+        """
+        if self.path_index is None:
+            return
+
+        if stamp_before != self._index_stamp or not exists(self.path_index):
+            self._rescan()
+            return
+
+        stamp = self._stamp()
+        # not O_APPEND - on Linux pwrite ignores the offset with O_APPEND
+        fd = os.open(self.path_index, os.O_RDWR)
+        try:
+            os.lseek(fd, 0, os.SEEK_END)
+            os.write(fd, "".join(f"{line}\n" for line in lines).encode())
+            os.pwrite(fd, self._index_header(stamp).encode(), 0)
+        finally:
+            os.close(fd)
+        self._index_stamp = stamp
 
+    def _rescan(self) -> None:
+        self.filenames = {}
+        self.namerefs = {}
+        self.nameversions = {}
+
+        stamp = self._stamp()
         for filename in self._list_binaries():
             self._register(filename)
 
+        if self.path_index is not None:
+            self._index_write(stamp)
+
+    def __init__(
+        self,
+        path: AnyPath,
+        path_index: AnyPath | None = None,
+        path_controls: AnyPath | None = None,
+        store: PackageStore | None = None,
+        path_access: AnyPath | None = None,
+    ) -> None:
+        self.path = str_path(path)
+        self.path_index = None if path_index is None else str_path(path_index)
+        self.path_access = (
+            None if path_access is None else str_path(path_access)
+        )
+        self.controls = ControlCache(path_controls)
+        self.store = store
+        # serializes changes to the cache (e.g., stocks syncing in parallel)
+        self.lock = threading.RLock()
+
+        self.filenames: dict[tuple[str, str], str] = {}
+        self.namerefs: dict[str, int] = {}
+        # name -> cached versions, sorted oldest to newest
+        self.nameversions: dict[str, list[str]] = {}
+        self._index_stamp: int | None = None
+        # bumped whenever a package is added or removed
+        self.generation = 0
+
+        if self.path_index is None or not self._index_read():
+            self._rescan()
+
+    def refresh(self) -> None:
+        """Reload the cache contents if the cache was changed by another
+        process (e.g., a concurrent sync)"""
+        with self.lock:
+            if self._index_stamp is not None and (
+                self._stamp() == self._index_stamp
+            ):
+                return
+            logger.debug(f"PackageCache({self.path}): reloading")
+            self.filenames = {}
+            self.namerefs = {}
+            self.nameversions = {}
+            self.generation += 1
+            if self.path_index is None or not self._index_read():
+                self._rescan()
+
     def getpath(self, name: str, version: str) -> str | None:
         """Returns path to package if it exists, or None otherwise."""
         filename = self.filenames.get((name, version))
@@ -220,34 +862,159 @@ class PackageCache:
             return True
         return exists(join(self.path, basename(name)))
 
+    def _import(self, path: str, filename: str) -> None:
+        """Link (or copy) binary at <path> into the cache as <filename>"""
+        dst = join(self.path, filename)
+        if self.store is not None:
+            self.store.link(path, self.controls.sha256(path), dst)
+        else:
+            hardlink_or_copy(path, dst)
+
     def add(self, path: AnyPath) -> None:
         """Add binary to cache. Hardlink if possible, copy otherwise."""
-        path_ = str_path(path)
-        suffix = splitext(path_)[1]
-        if suffix not in (".deb", ".udeb"):
-            raise PoolError(f"illegal package suffix ({suffix})")
+        self.add_many([path], workers=1)
+
+    def add_many(
+        self, paths: Iterable[AnyPath], workers: int | None = None
+    ) -> None:
+        """Add binaries to cache, parsing and importing up to <workers>
+        binaries concurrently (defaults to the number of CPUs).
 
-        deb = debfile.DebFile(path_)
-        name = deb.debcontrol()["Package"]
-        version = deb.debcontrol()["Version"]
+        If several binaries have the same package name and version, the first
+        one wins - as if they were added one by one.
+        """
+        paths_ = [str_path(path) for path in paths]
+        for path_ in paths_:
+            suffix = splitext(path_)[1]
+            if suffix not in (".deb", ".udeb"):
+                raise PoolError(f"illegal package suffix ({suffix})")
 
-        if self.exists(name, version):
+        if not paths_:
             return
 
-        arch = deb.debcontrol()["Architecture"]
-        filename = f"{name}_{version}_{arch}{suffix}"
-        path_cached = join(self.path, filename)
-        hardlink_or_copy(path_, path_cached)
+        def _map(func: Callable, *iterables: Iterable) -> list:
+            if workers == 1 or len(paths_) == 1:
+                return list(map(func, *iterables))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(func, *iterables))
+
+        # the control cache is thread safe, parse outside of the cache lock
+        controls = _map(self.controls.get, paths_)
+
+        with self.lock:
+            imports: dict[tuple[str, str], tuple[str, str]] = {}
+            for path_, control in zip(paths_, controls, strict=True):
+                name = control["Package"]
+                version = control["Version"]
+                if self.exists(name, version) or (name, version) in imports:
+                    continue
+
+                arch = control["Architecture"]
+                suffix = splitext(path_)[1]
+                filename = f"{name}_{version}_{arch}{suffix}"
+                imports[(name, version)] = (path_, filename)
+
+            if not imports:
+                return
 
-        self._register(filename)
+            stamp = self._stamp()
+            _map(self._import, *zip(*imports.values(), strict=True))
+
+            filenames = [filename for _, filename in imports.values()]
+            for filename in filenames:
+                self._register(filename)
+            self._index_update(
+                [f"+{filename}" for filename in filenames], stamp
+            )
 
     def remove(self, name: str, version: str) -> None:
         """Remove a specific package/version from the cache"""
+        with self.lock:
+            path = self.getpath(name, version)
+            if not path:
+                return
+            stamp = self._stamp()
+            os.remove(path)
+            self._unregister(name, version)
+            self._index_update([f"-{basename(path)}"], stamp)
+
+    def touch(self, name: str, version: str) -> None:
+        """Record an access to a cached package in the access log"""
+        filename = self.filenames.get((name, version))
+        if self.path_access is None or not filename:
+            return
+        try:
+            with open(self.path_access, "a") as fob:
+                fob.write(f"{int(time.time())} {filename}\n")
+        except PermissionError as e:
+            # a pool we can read but not write doesn't track its users
+            logger.debug(f"can't log access to {filename}: {e}")
+
+    def last_access(self) -> dict[str, float]:
+        """Returns {filename: time of last access} of cached packages.
+
+        Packages that have no logged access fall back to their mtime.
+        """
+        access: dict[str, float] = {}
+        if self.path_access is not None and exists(self.path_access):
+            with open(self.path_access) as fob:
+                for line in fob:
+                    timestamp, _, filename = line.rstrip("\n").partition(" ")
+                    try:
+                        access[filename] = max(
+                            float(timestamp), access.get(filename, 0)
+                        )
+                    except ValueError:
+                        continue
+
+        last_access = {}
+        for filename in self.filenames.values():
+            if filename in access:
+                last_access[filename] = access[filename]
+            else:
+                last_access[filename] = os.stat(
+                    join(self.path, filename)
+                ).st_mtime
+        return last_access
+
+    def compact_access_log(self) -> None:
+        """Rewrite the access log with the last access of cached packages.
+
+        Accesses logged while it runs are lost, so the caller must hold the
+        pool's lock exclusively (as gc does).
+        """
+        if self.path_access is None or not exists(self.path_access):
+            return
+        last_access = self.last_access()
+        fd, tmp_path = tempfile.mkstemp(
+            dir=dirname(self.path_access), prefix=".pkgcache-access."
+        )
+        with os.fdopen(fd, "w") as fob:
+            for filename, timestamp in sorted(last_access.items()):
+                fob.write(f"{int(timestamp)} {filename}\n")
+        os.replace(tmp_path, self.path_access)
+
+    def versions(self, name: str) -> list[str]:
+        """Returns cached versions of package <name>, oldest first.
+
+        Versions that aren't valid Debian versions are left out.
+        """
+        return list(self.nameversions.get(name, []))
+
+    def newest(self, name: str) -> str | None:
+        """Returns newest cached version of package <name> or None"""
+        versions = self.nameversions.get(name)
+        if not versions:
+            return None
+        return versions[-1]
+
+    def control(self, name: str, version: str) -> dict[str, str] | None:
+        """Returns control fields of a cached package or None if not cached.
+        """
         path = self.getpath(name, version)
         if not path:
-            return
-        os.remove(path)
-        self._unregister(name, version)
+            return None
+        return self.controls.get(path)
 
     def list(self) -> list[tuple[str, str]]:
         """List packages in package cache -> list of (package, version)"""
@@ -281,12 +1048,15 @@ class StockBase:
     @property
     def binaries(self) -> list[str]: ...
 
-    def sync(self) -> None: ...
+    def sync(self, jobs: int = 1) -> None: ...
+
+    def is_fresh(self) -> bool: ...
 
     sync_head: "_SyncHead"
     workdir: "_Workdir"
     _workdir: str | None
 
+    path_index: str
     path_index_sources: str
     path_index_binaries: str
     path_sync_head: str
@@ -294,37 +1064,81 @@ class StockBase:
     path_pool: str
     path_root: str
 
+    # bumped whenever the stock is re-indexed
+    generation: int
+
     def _get_workdir(self) -> str | None: ...
 
-    def __init__(self, path: AnyPath) -> None:
-        logger.debug(f"StockBase(path={path!r})")
+    def __init__(self, path: AnyPath, link: str | None = None) -> None:
+        """<link> is the target of the stock link, if already known (e.g.,
+        from the stock manifest)"""
+        logger.debug(f"StockBase(path={path!r}, link={link!r})")
         path_ = str_path(path)
         self.path_root = path_
         self.link_path = join(path_, "link")
 
         self.name = basename(path_)
-        if not exists(self.link_path):
-            raise StockBase.StockBaseError(
-                f"stock link {self.link_path!r} doesn't exist"
-            )
+        if link is None:
+            if not exists(self.link_path):
+                raise StockBase.StockBaseError(
+                    f"stock link {self.link_path!r} doesn't exist"
+                )
+            link = os.readlink(self.link_path)
 
-        self.link = os.readlink(self.link_path)
+        self.link = link
         if not isdir(self.link):
             raise StockBase.StockBaseError(
                 f"stock link to non-directory `{self.link}'"
             )
 
 
+def read_sync_epoch(path: str) -> float | None:
+    """Returns the time of the last completed sync recorded in the
+    sync.epoch file at <path>, or None"""
+    try:
+        with open(path) as fob:
+            return float(fob.read())
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logger.warning(f"ignoring corrupt {path}")
+        return None
+
+
+class _SubpoolKernel:
+    """Magical attribute for lazy instantiation of a subpool's kernel.
+
+    Subpools are only placeholders until a lookup actually needs one, so
+    a pool with many subpools doesn't pay for loading all of them.
+    """
+
+    def __get__(
+        self, obj: "StockPool", _: type["StockPool"]
+    ) -> "PoolKernel":
+        if obj._pool is None:
+            logger.debug(f"loading subpool {obj.path}")
+            obj._pool = PoolKernel(obj.link, obj.recursed_paths)
+        return obj._pool
+
+
 class StockPool(StockBase):
-    """Class for managing a subpool-type stock"""
+    """Class for managing a subpool-type stock.
+
+    The subpool's PoolKernel is instantiated on first access of pool.
+    """
+
+    pool = _SubpoolKernel()
 
     def __init__(
-        self, path: AnyPath, recursed_paths: list[str] | None = None
+        self,
+        path: AnyPath,
+        recursed_paths: list[str] | None = None,
+        link: str | None = None,
     ) -> None:
         logger.debug(
             f"StockPool(path={path!r}, recursed_paths={recursed_paths!r})"
         )
-        super().__init__(path)
+        super().__init__(path, link)
         if recursed_paths is None:
             recursed_paths = []
 
@@ -334,7 +1148,25 @@ class StockPool(StockBase):
                 f" paths {recursed_paths}"
             )
 
-        self.pool = PoolKernel(self.link, recursed_paths)
+        path_pool = join(realpath(self.link), ".pool")
+        if not isdir(path_pool):
+            raise StockError(f"no pool found at `{self.link}'")
+
+        self.recursed_paths = recursed_paths
+        # same as the path of the subpool's kernel, once it's loaded
+        self.path = dirname(path_pool)
+        self._pool: PoolKernel | None = None
+
+    @property
+    def synced(self) -> float | None:
+        """time of the subpool's last completed sync, read from disk
+        without loading the subpool"""
+        return read_sync_epoch(join(self.path, ".pool/sync.epoch"))
+
+    @property
+    def indexed(self) -> bool:
+        """True if the subpool's package cache index is on disk"""
+        return exists(join(self.path, ".pool/pkgcache.index"))
 
 
 class _Workdir:
@@ -362,7 +1194,7 @@ class _SyncHead:
         path = obj.path_sync_head
         if exists(path):
             with open(path) as fob:
-                fob.read().rstrip()
+                return fob.read().rstrip() or None
 
         return None
 
@@ -376,6 +1208,64 @@ class _SyncHead:
                 fob.write(f"{val}\n")
 
 
+class _SyncEpoch:
+    """Magical attribute for the time (seconds since the epoch) of the last
+    completed sync of a pool, or None if it isn't known to be in sync.
+
+    Set writes the pool's sync.epoch file (None removes it). Get reads it.
+    """
+
+    def __get__(self, obj: "PoolKernel", _: type["PoolKernel"]) -> Any:
+        return read_sync_epoch(obj.path_sync_epoch)
+
+    def __set__(self, obj: "PoolKernel", val: float | None) -> None:
+        path = obj.path_sync_epoch
+        try:
+            if val is None:
+                if exists(path):
+                    os.remove(path)
+                return
+            fd, tmp_path = tempfile.mkstemp(
+                dir=dirname(path), prefix=".sync.epoch."
+            )
+            with os.fdopen(fd, "w") as fob:
+                fob.write(f"{val}\n")
+            os.replace(tmp_path, path)
+        except PermissionError as e:
+            # a pool we can read but not write just isn't trusted to be in
+            # sync - stocks are checked for changes every time
+            logger.debug(f"can't update sync epoch: {e}")
+
+
+class _StockIndex:
+    """Magical attribute for lazy loading of a stock's index.
+
+    The index is read from disk the first time source_versions,
+    binary_paths or dir_fingerprints is accessed, so stocks that aren't
+    queried cost nothing.
+    """
+
+    def __set_name__(self, owner: type["Stock"], name: str) -> None:
+        self.attr = f"_{name}"
+
+    def __get__(self, obj: "Stock", _: type["Stock"]) -> Any:
+        if getattr(obj, self.attr) is None:
+            source_versions, binary_paths, dir_fingerprints = (
+                obj._init_read_index()
+            )
+            # don't clobber a value that has already been set
+            if obj._source_versions is None:
+                obj._source_versions = source_versions
+            if obj._binary_paths is None:
+                obj._binary_paths = binary_paths
+            if obj._dir_fingerprints is None:
+                obj._dir_fingerprints = dir_fingerprints
+        return getattr(obj, self.attr)
+
+    def __set__(self, obj: "Stock", val: Any) -> None:
+        setattr(obj, self.attr, val)
+
+
 class Stock(StockBase):
     """Class for managing a non-subpool-type stock."""
 
@@ -393,22 +1283,28 @@ class Stock(StockBase):
         if not self.branch:
             return self.link
 
-        orig = Git(self.link)
         checkout_path = self.path_checkout
 
         if not exists(checkout_path):
             mkdir(checkout_path)
             checkout = Git.init_create(checkout_path)
-            checkout.set_alternates(orig)
+            checkout.set_alternates(Git(self.link))
         else:
             checkout = Git(checkout_path)
 
         def dup_branch(branch: str) -> None:
             # checkout latest changes
-            commit = orig.rev_parse(branch.replace("%2F", "/"))
+            commit = self.git.get(self.link).rev_parse(
+                branch.replace("%2F", "/")
+            )
             if not commit:
                 raise StockError(f"no such branch `{branch}' at {self.link}")
-            checkout.update_ref(f"refs/heads/{branch}", commit)
+            try:
+                self.git.get(checkout_path).update_refs(
+                    [f"update refs/heads/{branch} {commit}"]
+                )
+            except GitSessionError as e:
+                raise StockError(str(e)) from e
 
         dup_branch(self.branch)
         checkout.checkout("-q", "-f", self.branch)
@@ -422,24 +1318,76 @@ class Stock(StockBase):
                 raise StockError(f"failed command: {command}")
             return join(checkout_path, "arena")
 
-        # update tags
-        for tag in checkout.list_tags():
-            checkout.remove_tag(tag)
+        self._mirror_tags(self.link, checkout_path)
+        return checkout_path
 
-        for tag in orig.list_tags():
-            try:
-                v = orig.rev_parse(tag)
-                assert v is not None
-                checkout.update_ref(f"refs/tags/{tag}", v)
-            except BaseException:  # TODO don't use bare except!
-                continue
+    @staticmethod
+    def _list_tag_refs(path: str) -> dict[str, str]:
+        """Return {refname: object id} for all tags of the git repo at
+        <path>"""
+        result = subprocess.run(
+            [
+                "git",
+                "-C",
+                path,
+                "for-each-ref",
+                "--format=%(refname) %(objectname)",
+                "refs/tags/",
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise StockError(
+                f"can't list tags at {path}: {result.stderr.strip()}"
+            )
+        return dict(line.split(" ", 1) for line in result.stdout.splitlines())
 
-        return checkout_path
+    def _mirror_tags(self, orig_path: str, checkout_path: str) -> None:
+        """make the tags of the checkout match those of the origin.
+
+        Only tags that were added, moved or removed in the origin since the
+        last time are touched, in a single update-ref transaction."""
+        orig_tags = self._list_tag_refs(orig_path)
+        checkout_tags = self._list_tag_refs(checkout_path)
+
+        commands = [
+            f"delete {ref}" for ref in checkout_tags if ref not in orig_tags
+        ]
+        commands += [
+            f"update {ref} {oid}"
+            for ref, oid in orig_tags.items()
+            if checkout_tags.get(ref) != oid
+        ]
+        logger.debug(
+            f"Stock[name={self.name!r}]._mirror_tags:"
+            f" {len(commands)} of {len(orig_tags)} tags changed"
+        )
+        try:
+            self.git.get(checkout_path).update_refs(commands)
+        except GitSessionError as e:
+            raise StockError(f"failed to update tags: {e}") from e
 
     _workdir: str | None
     workdir = _Workdir()
 
+    _source_versions: dict[str, list[str]] | None
+    _binary_paths: set[str] | None
+    _dir_fingerprints: dict[str, str] | None
+    source_versions = _StockIndex()
+    binary_paths = _StockIndex()
+    dir_fingerprints = _StockIndex()
+
+    INDEX_MAGIC = "pool-stock-index"
+    INDEX_VERSION = 1
+
+    # fingerprints of directories modified less than this long before a
+    # sync started aren't trusted - a later change within the same mtime
+    # tick would go unnoticed (2 seconds covers the coarsest filesystems)
+    FINGERPRINT_RACY_NS = 2_000_000_000
+
     def _init_read_versions(self) -> dict[str, list[str]]:
+        """read source versions from the old index-sources tree layout"""
         source_versions = {}
         for dpath, _, fnames in os.walk(self.path_index_sources):
             relative_path = relpath(dpath, self.path_index_sources)
@@ -450,79 +1398,378 @@ class Stock(StockBase):
                 source_versions[join(relative_path, fname)] = versions
         return source_versions
 
-    def __init__(self, path: AnyPath, pkgcache: PackageCache) -> None:
-        StockBase.__init__(self, path)
-        logger.debug(f"Stock(path={path!r}, pkgcache={pkgcache!r})")
-        spath = str_path(path)
-        self.path_index_sources = join(spath, "index-sources")
-        self.path_index_binaries = join(spath, "index-binaries")
-        self.path_sync_head = join(spath, "SYNC_HEAD")
-        self.path_checkout = join(spath, "CHECKOUT")
-        self.path_pool = spath
+    def _init_read_binaries(self) -> set[str]:
+        """read binary paths from the old index-binaries tree layout"""
+        relative_paths = set()
+        for dpath, _, fnames in os.walk(self.path_index_binaries):
+            for fname in fnames:
+                fpath = join(dpath, fname)
+                relative_paths.add(relpath(fpath, self.path_index_binaries))
+        return relative_paths
+
+    def _init_read_index(
+        self,
+    ) -> tuple[dict[str, list[str]], set[str], dict[str, str]]:
+        """read the stock index
+        -> (source_versions, binary_paths, dir_fingerprints)
+
+        The index is a single sorted text file. After a header line with the
+        number of sources and binaries there's one tab separated entry per
+        line:
+
+            S <relative/path/package> <version>...
+            B <relative/path/binary.deb>
+            D <relative/path> <fingerprint>
+
+        D entries are only written for plain directory stocks (see
+        _fingerprint).
+
+        Stocks synced before the index file existed are read from the old
+        index-sources/index-binaries trees until their next sync.
+        """
+        try:
+            with open(self.path_index) as fob:
+                data = fob.read()
+        except FileNotFoundError:
+            return self._init_read_versions(), self._init_read_binaries(), {}
+
+        lines = data.splitlines()
+        if not lines or lines[0].split()[:2] != [
+            self.INDEX_MAGIC,
+            str(self.INDEX_VERSION),
+        ]:
+            logger.warning(f"ignoring unknown stock index {self.path_index}")
+            return {}, set(), {}
+
+        source_versions: dict[str, list[str]] = {}
+        binary_paths: set[str] = set()
+        dir_fingerprints: dict[str, str] = {}
+        for line in lines[1:]:
+            kind, path, *versions = line.split("\t")
+            if kind == "S":
+                source_versions[path] = versions
+            elif kind == "B":
+                binary_paths.add(path)
+            elif kind == "D":
+                dir_fingerprints[path] = versions[0]
+        return source_versions, binary_paths, dir_fingerprints
+
+    @property
+    def summary(self) -> tuple[int, int]:
+        """Returns (number of sources, number of binaries) in this stock.
+
+        Cheap - only reads the index header unless the index is loaded
+        already or the stock still uses the old index layout.
+        """
+        if self._source_versions is None and self._binary_paths is None:
+            try:
+                with open(self.path_index) as fob:
+                    header = fob.readline().split()
+                if len(header) == 4:
+                    return int(header[2]), int(header[3])
+            except FileNotFoundError:
+                pass
+        return len(self.source_versions), len(self.binary_paths)
+
+    def _write_index(self) -> None:
+        """atomically write the in-memory index to the stock index file"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.path_pool, prefix=".index.")
+        with os.fdopen(fd, "w") as fob:
+            # the header carries a summary which can be read on its own
+            fob.write(
+                f"{self.INDEX_MAGIC} {self.INDEX_VERSION}"
+                f" {len(self.source_versions)} {len(self.binary_paths)}\n"
+            )
+            for path, versions in sorted(self.source_versions.items()):
+                fob.write("\t".join(["S", path, *versions]) + "\n")
+            for path in sorted(self.binary_paths):
+                fob.write(f"B\t{path}\n")
+            for path, fingerprint in sorted(self.dir_fingerprints.items()):
+                fob.write(f"D\t{path}\t{fingerprint}\n")
+        os.replace(tmp_path, self.path_index)
+        self.generation += 1
+
+        # migrated - the old tree layout is no longer needed
+        for path in (self.path_index_sources, self.path_index_binaries):
+            if exists(path):
+                shutil.rmtree(path)
+
+    def __init__(
+        self,
+        path: AnyPath,
+        pkgcache: PackageCache,
+        git: GitSessions | None = None,
+        link: str | None = None,
+        branch: str | None = None,
+    ) -> None:
+        """<git> is shared by stocks for reusing git processes; each stock
+        gets its own if not provided.
 
-        self.branch = None
-        if "#" in self.name:
-            self.branch = self.name.split("#")[1]
+        <link> and <branch> are taken from the stock manifest if given,
+        otherwise they are read from the stock link and name."""
+        StockBase.__init__(self, path, link)
+        logger.debug(f"Stock(path={path!r}, pkgcache={pkgcache!r})")
+        spath = str_path(path)
+        self.path_index = join(spath, "index")
+        self.path_index_sources = join(spath, "index-sources")
+        self.path_index_binaries = join(spath, "index-binaries")
+        self.path_sync_head = join(spath, "SYNC_HEAD")
+        self.path_checkout = join(spath, "CHECKOUT")
+        self.path_pool = spath
 
-        self.source_versions = self._init_read_versions()
+        if link is None and "#" in self.name:
+            branch = self.name.split("#")[1]
+        self.branch = branch
+
+        # loaded on demand, see _StockIndex
+        self.source_versions = None
+        self.binary_paths = None
+        self.dir_fingerprints = None
         self.workdir = None
         self.pkgcache = pkgcache
+        self.git = GitSessions() if git is None else git
+        self.generation = 0
 
-    def _sync_update_source_versions(self, directory: str) -> None:
+    def _sync_update_source_versions(
+        self, directory: str, packages: list[str], versions: list[str]
+    ) -> None:
         """update versions for a particular source package at <dir>"""
         logger.debug(
             f"Stock[name={self.name!r}]._sync_update_source_versions"
             f"({directory=})"
         )
-        packages = deb_get_packages(directory)
-        versions = verseek.list_versions(directory)
-
         relative_path = relpath(directory, self.workdir)
-        source_versions_path = join(self.path_index_sources, relative_path)
-        mkdir(source_versions_path)
-
         for package in packages:
-            with open(join(source_versions_path, package), "w") as fob:
-                for version in versions:
-                    fob.write(f"{version}\n")
-
             self.source_versions[join(relative_path, package)] = versions
 
     def _sync_update_binary_versions(self, path: str) -> None:
         logger.debug(
             f"Stock[name={self.name!r}]._sync_update_binary_versions ({path=})"
         )
-        binary_version_path = join(
-            self.path_index_binaries, relpath(path, self.workdir)
-        )
-        mkdir(dirname(binary_version_path))
-        with open(binary_version_path, "w") as fob:  # create zero length file
-            fob.truncate()
+        self.binary_paths.add(relpath(path, self.workdir))
 
-    def _sync(self, directory: str | None = None) -> None:
+    def _sync_walk(
+        self, directory: str, sources: list[str], binaries: list[str]
+    ) -> None:
         """recursive sync back-end.
-        updates versions of source packages and adds binaries to cache"""
+        collects source package directories and binaries"""
+        logger.debug(
+            f"Stock[name={self.name!r}]._sync_walk(directory={directory!r})"
+        )
+
+        if isfile(join(directory, "debian/control")):
+            sources.append(directory)
+            return
+
+        # dirent types save a stat per entry on most filesystems
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    self._sync_walk(entry.path, sources, binaries)
+                elif entry.is_file(follow_symlinks=False) and splitext(
+                    entry.name
+                )[1] in (".deb", ".udeb"):
+                    binaries.append(entry.path)
+
+    def _fingerprint(self, directory: str, before: int) -> str:
+        """Return a fingerprint of <directory> which changes whenever a sync
+        would index it differently.
+
+        For a plain directory that's its inode, mtime and link count (which
+        counts subdirectories), covering entries being added, removed or
+        renamed. Changes further down are covered by the fingerprints of the
+        subdirectories themselves. For a source package directory the stats
+        of debian/control and debian/changelog are included as well, which
+        is all the package names and versions are computed from.
+
+        The fingerprint is just the kind ("dir" or "src") - which never
+        matches - if it can't be trusted: anything was modified at or after
+        <before> (nanoseconds since the epoch), or the source package is a
+        git repository, in which case its versions depend on git history.
+
+        Files in a plain directory aren't stat'ed, so a binary overwritten in
+        place (rather than replaced by a new file, e.g., via a rename) goes
+        unnoticed until something else changes the directory. Binaries are
+        expected to be named after their version, so that's only a
+        different binary under the same name.
+        """
+        st = os.stat(directory)
+        stats = [st]
+        kind = "dir"
+        try:
+            control = os.stat(join(directory, "debian/control"))
+        except (FileNotFoundError, NotADirectoryError):
+            control = None
+        if control is not None and stat.S_ISREG(control.st_mode):
+            kind = "src"
+            if exists(join(directory, ".git")):
+                return kind
+            stats.append(control)
+            try:
+                stats.append(os.stat(join(directory, "debian/changelog")))
+            except FileNotFoundError:
+                pass
+
+        if any(st.st_mtime_ns >= before for st in stats):
+            return kind
+
+        fields = [kind, str(st.st_ino), str(st.st_mtime_ns), str(st.st_nlink)]
+        for st in stats[1:]:
+            fields += [str(st.st_ino), str(st.st_size), str(st.st_mtime_ns)]
+        return " ".join(fields)
+
+    def _sync_sources(self, directories: list[str], jobs: int = 1) -> None:
+        """compute versions of the source packages at <directories> and
+        index them. Up to <jobs> packages are versioned concurrently."""
         logger.debug(
-            f"Stock[name={self.name!r}]._sync(directory={directory!r})"
+            f"Stock[name={self.name!r}]._sync_sources"
+            f"({len(directories)} directories, {jobs=})"
         )
 
-        directory = self.workdir if directory is None else directory
+        def list_versions(directory: str) -> tuple[list[str], list[str]]:
+            packages = deb_get_packages(directory)
+            return packages, verseek.list_versions(directory)
+
+        results: Iterable[tuple[list[str], list[str]]]
+        if jobs <= 1 or len(directories) <= 1:
+            results = map(list_versions, directories)
+        else:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(list_versions, directories))
+
+        for directory, (packages, versions) in zip(
+            directories, results, strict=True
+        ):
+            self._sync_update_source_versions(directory, packages, versions)
+
+    def _sync_binaries(self, binaries: list[str]) -> None:
+        """add <binaries> to the cache and index them"""
+        self.pkgcache.add_many(binaries)
+        for fpath in binaries:
+            self._sync_update_binary_versions(fpath)
+
+    def _uncached_binaries(self, paths: Iterable[str]) -> list[str]:
+        """Returns the full paths of the indexed binaries <paths> that may be
+        missing from the cache (e.g., because another stock that shipped the
+        same file was unregistered). Binaries the cache holds under another
+        filename are returned too - add_many skips them."""
+        workdir = self.workdir
+        assert workdir is not None
+        cached = set(self.pkgcache.filenames.values())
+        return [
+            join(workdir, path)
+            for path in sorted(paths)
+            if basename(path) not in cached
+        ]
+
+    def _sync(self, jobs: int = 1) -> None:
+        """updates versions of source packages and adds binaries to cache.
+
+        Runs in two phases: first discover all source packages and binaries,
+        then version the sources (up to <jobs> at a time) and import the
+        binaries."""
+        logger.debug(f"Stock[name={self.name!r}]._sync({jobs=})")
+        directory = self.workdir
         assert directory is not None
 
-        if isfile(join(directory, "debian/control")):
-            return self._sync_update_source_versions(directory)
+        sources: list[str] = []
+        binaries: list[str] = []
+        self._sync_walk(directory, sources, binaries)
 
-        for fname in os.listdir(directory):
-            fpath = join(directory, fname)
-            if (
-                not islink(fpath)
-                and isfile(fpath)
-                and splitext(fname)[1] in (".deb", ".udeb")
-            ):
-                self.pkgcache.add(fpath)
-                self._sync_update_binary_versions(fpath)
-            if isdir(fpath):
-                self._sync(fpath)
+        self._sync_sources(sources, jobs)
+        self._sync_binaries(binaries)
+
+    def _sync_fingerprinted(self, jobs: int = 1) -> bool:
+        """sync a plain directory stock, skipping what hasn't changed.
+
+        Each directory is fingerprinted (see _fingerprint). Source packages
+        with an unchanged fingerprint keep their indexed versions, and
+        directories with an unchanged fingerprint keep their indexed binaries
+        and are descended into without being listed - their subdirectories
+        are known from the previous sync. Binaries in unchanged directories
+        are only added to the cache again if they're missing from it.
+
+        Returns False if nothing changed.
+        """
+        logger.debug(f"Stock[name={self.name!r}]._sync_fingerprinted()")
+        workdir = self.workdir
+        assert workdir is not None
+
+        def parent(path: str) -> str:
+            return dirname(path) or "."
+
+        old_fingerprints = self.dir_fingerprints
+        subdirs: dict[str, list[str]] = {}
+        for path in old_fingerprints:
+            if path != ".":
+                subdirs.setdefault(parent(path), []).append(path)
+
+        old_sources: dict[str, dict[str, list[str]]] = {}
+        for path, versions in self.source_versions.items():
+            old_sources.setdefault(parent(path), {})[path] = versions
+        old_binaries: dict[str, list[str]] = {}
+        for path in self.binary_paths:
+            old_binaries.setdefault(parent(path), []).append(path)
+
+        before = time.time_ns() - self.FINGERPRINT_RACY_NS
+        source_versions: dict[str, list[str]] = {}
+        binary_paths: set[str] = set()
+        fingerprints: dict[str, str] = {}
+        sources: list[str] = []
+        binaries: list[str] = []
+
+        def walk(relative_path: str) -> None:
+            directory = os.path.normpath(join(workdir, relative_path))
+            try:
+                fingerprint = self._fingerprint(directory, before)
+            except (FileNotFoundError, NotADirectoryError):
+                # a directory from the last sync which is gone now
+                return
+            fingerprints[relative_path] = fingerprint
+            unchanged = (
+                " " in fingerprint
+                and old_fingerprints.get(relative_path) == fingerprint
+            )
+
+            if fingerprint.startswith("src"):
+                if unchanged:
+                    source_versions.update(old_sources.get(relative_path, {}))
+                else:
+                    sources.append(directory)
+                return
+
+            if unchanged:
+                binary_paths.update(old_binaries.get(relative_path, []))
+                for path in subdirs.get(relative_path, []):
+                    walk(path)
+                return
+
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        walk(relpath(entry.path, workdir))
+                    elif entry.is_file(follow_symlinks=False) and splitext(
+                        entry.name
+                    )[1] in (".deb", ".udeb"):
+                        binaries.append(entry.path)
+
+        walk(".")
+        logger.debug(
+            f"Stock[name={self.name!r}]: {len(sources)} sources and"
+            f" {len(binaries)} binaries changed"
+        )
+        binaries += self._uncached_binaries(binary_paths)
+
+        old_index = (self.source_versions, self.binary_paths)
+        self.source_versions = source_versions
+        self.binary_paths = binary_paths
+        self.dir_fingerprints = fingerprints
+        self._sync_sources(sources, jobs)
+        self._sync_binaries(binaries)
+        return (
+            fingerprints != old_fingerprints
+            or (self.source_versions, self.binary_paths) != old_index
+        )
 
     @property
     def binaries(self) -> list[str]:
@@ -530,13 +1777,7 @@ class Stock(StockBase):
 
         Returns [ relative/path/foo.deb, ... ]
         """
-        relative_paths: list[str] = []
-        for dpath, _, fnames in os.walk(self.path_index_binaries):
-            for fname in fnames:
-                fpath = join(dpath, fname)
-                relative_paths.append(relpath(fpath, self.path_index_binaries))
-
-        return relative_paths
+        return sorted(self.binary_paths)
 
     @property
     def sources(self) -> list[tuple[str, list[str]]]:
@@ -546,25 +1787,198 @@ class Stock(StockBase):
         """
         return list(self.source_versions.items())
 
-    def sync(self) -> None:
-        """sync stock by updating source versions and importing binaries into
-        the cache"""
-        logger.debug(f"Stock[name={self.name!r}].sync()")
+    def _git_changed_paths(self, since: str) -> list[str] | None:
+        """List paths changed in the checkout between <since> and HEAD.
+        Returns None if git can't tell (e.g., <since> no longer exists)"""
+        result = subprocess.run(
+            [
+                "git",
+                "-C",
+                self.path_checkout,
+                "diff",
+                "--name-only",
+                "--no-renames",
+                "-z",
+                since,
+                "HEAD",
+                "--",
+            ],
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            logger.info(
+                f"Stock[name={self.name!r}]: can't diff {since}..HEAD:"
+                f" {os.fsdecode(result.stderr).strip()}"
+            )
+            return None
+        return [os.fsdecode(p) for p in result.stdout.split(b"\0") if p]
+
+    def _source_root(self, relative_path: str) -> str | None:
+        """Return the outermost source package directory containing
+        <relative_path> - i.e., the directory a full sync would index it
+        under - or None if it isn't inside a source package"""
+        assert self.workdir is not None
+        parts = relative_path.split("/")[:-1]
+        for i in range(len(parts) + 1):
+            directory = "/".join(parts[:i]) or "."
+            if isfile(join(self.workdir, directory, "debian/control")):
+                return directory
+        return None
+
+    def _drop_index(self, relative_path: str) -> None:
+        """drop index entries for sources and binaries at or under
+        <relative_path>"""
+        logger.debug(
+            f"Stock[name={self.name!r}]._drop_index({relative_path=})"
+        )
+        for path in list(self.source_versions):
+            if _path_is_under(dirname(path), relative_path):
+                del self.source_versions[path]
+
+        self.binary_paths = {
+            path
+            for path in self.binary_paths
+            if not _path_is_under(path, relative_path)
+        }
+
+    def _sync_incremental(self, since: str, jobs: int = 1) -> bool:
+        """Sync only what changed since commit <since>.
+
+        Returns False if an incremental sync isn't possible, in which case
+        nothing has been touched and a full sync is needed.
+        """
+        logger.debug(f"Stock[name={self.name!r}]._sync_incremental({since})")
+        workdir = self.workdir
+        if workdir != self.path_checkout:
+            return False
+
+        changed = self._git_changed_paths(since)
+        if changed is None:
+            return False
+
+        old_source_dirs = {dirname(path) for path in self.source_versions}
+        dirty: set[str] = set()
+        binary_paths: set[str] = set()
+        for path in changed:
+            source_root = self._source_root(path)
+            if source_root is not None:
+                dirty.add(source_root)
+                continue
+
+            # a source package that isn't a source package any more
+            gone = {
+                directory
+                for directory in old_source_dirs
+                if _path_is_under(path, directory)
+            }
+            if gone:
+                dirty |= gone
+            elif splitext(path)[1] in (".deb", ".udeb"):
+                binary_paths.add(path)
+
+        # re-walk each dirty subtree once, from its outermost directory
+        dirty = {
+            directory
+            for directory in dirty
+            if not any(
+                directory != other and _path_is_under(directory, other)
+                for other in dirty
+            )
+        }
+        sources: list[str] = []
+        binaries: list[str] = []
+        for directory in sorted(dirty):
+            self._drop_index(directory)
+            if isdir(join(workdir, directory)):
+                self._sync_walk(
+                    os.path.normpath(join(workdir, directory)),
+                    sources,
+                    binaries,
+                )
+
+        for path in sorted(binary_paths):
+            if any(_path_is_under(path, directory) for directory in dirty):
+                continue
+            self._drop_index(path)
+            fpath = join(workdir, path)
+            if not islink(fpath) and isfile(fpath):
+                binaries.append(fpath)
+
+        # what's left of the index is unchanged
+        binaries += self._uncached_binaries(self.binary_paths)
+        self._sync_sources(sources, jobs)
+        self._sync_binaries(binaries)
+        return True
+
+    def is_fresh(self) -> bool:
+        """Cheaply check that syncing the stock wouldn't change anything.
+
+        A git stock is fresh if its branch still points at the synced head.
+        A plain directory stock is fresh if none of its directories' stored
+        fingerprints (see _fingerprint) changed - that's a stat or three per
+        directory, without listing any of them.
+        """
         if self.branch:
-            if (
-                Git(self.link).rev_parse(self.branch.replace("%2F", "/"))
-                == self.sync_head
-            ):
-                return
+            sync_head = self.sync_head
+            return sync_head is not None and sync_head == self.git.get(
+                self.link
+            ).rev_parse(self.branch.replace("%2F", "/"))
+
+        fingerprints = self.dir_fingerprints
+        if not fingerprints or not exists(self.path_index):
+            return False
+        # an untrusted fingerprint is just the kind, which never matches
+        if any(" " not in fp for fp in fingerprints.values()):
+            return False
+        workdir = self.workdir
+        assert workdir is not None
+        before = time.time_ns() - self.FINGERPRINT_RACY_NS
+        try:
+            return all(
+                self._fingerprint(
+                    os.path.normpath(join(workdir, path)), before
+                )
+                == fingerprint
+                for path, fingerprint in fingerprints.items()
+            )
+        except OSError:
+            return False
+
+    def sync(self, jobs: int = 1) -> None:
+        """sync stock by updating source versions and importing binaries into
+        the cache. Up to <jobs> source packages are versioned concurrently.
+
+        If the stock is a git branch that was synced before, only the source
+        packages and binaries that changed since the last synced commit are
+        re-indexed. If it's a plain directory, only directories that changed
+        since the last sync are."""
+        logger.debug(f"Stock[name={self.name!r}].sync({jobs=})")
+        if not self.branch:
+            if self._sync_fingerprinted(jobs) or not exists(self.path_index):
+                self._write_index()
+            return
+
+        sync_head = self.sync_head
+        if (
+            self.git.get(self.link).rev_parse(self.branch.replace("%2F", "/"))
+            == sync_head
+        ):
+            return
+        if sync_head is not None and self._sync_incremental(sync_head, jobs):
+            self._write_index()
+            self.sync_head = self.git.get(self.path_checkout).rev_parse("HEAD")
+            return
         # delete old cached versions
-        for path in (self.path_index_sources, self.path_index_binaries):
-            if exists(path):
-                shutil.rmtree(path)
-                mkdir(path)
         self.source_versions = {}
-        self._sync()
-        if self.branch:
-            self.sync_head = Git(self.path_checkout).rev_parse("HEAD")
+        self.binary_paths = set()
+        self.dir_fingerprints = {}
+        self._sync(jobs)
+        self._write_index()
+        self.sync_head = self.git.get(self.path_checkout).rev_parse("HEAD")
+
+    def __str__(self) -> str:
+        sources, binaries = self.summary
+        return f"{self.name} ({sources} sources, {binaries} binaries)"
 
     def __repr__(self) -> str:
 
@@ -576,8 +1990,7 @@ class Stock(StockBase):
             return return_str
 
         return (
-            f"Stock(\n\tpath_index_sources={self.path_index_sources},"
-            f"\n\tpath_index_binaries={self.path_index_binaries},"
+            f"Stock(\n\tpath_index={self.path_index},"
             f"\n\tpath_sync_head={self.path_sync_head},"
             f"\n\tpath_checkout={self.path_checkout},"
             f"\n\tpath_pool={self.path_pool},"
@@ -589,18 +2002,129 @@ class Stock(StockBase):
         )
 
 
+# source package name -> [(stock, relative/path/name, versions), ...]
+NameIndex = dict[str, list[tuple[StockBase, str, frozenset[str]]]]
+
+
+class ManifestEntry(NamedTuple):
+    """A registered stock, as recorded in the stock manifest.
+
+    <kind> is one of "pool", "git" or "plain". The head a git stock was
+    last synced to isn't recorded here - SYNC_HEAD is the only record of it.
+    """
+
+    kind: str
+    link: str
+    branch: str | None = None
+
+
 class Stocks:
     """Class for managing and quering Pool Stocks in aggregate.
 
     Iterating an instance of this class produces all non-subpool type stocks.
     """
 
+    MANIFEST_MAGIC = "pool-stocks-manifest"
+    MANIFEST_VERSION = 2
+
+    def _read_manifest(self) -> dict[str, ManifestEntry] | None:
+        """read the stock manifest -> {stock name: entry} or None if there's
+        no usable manifest.
+
+        After a header line there's one tab separated line per stock, in
+        load order:
+
+            <name> <kind> <link> <branch>
+
+        where a missing branch is written as "-".
+        """
+        try:
+            with open(self.path_manifest) as fob:
+                lines = fob.read().splitlines()
+        except FileNotFoundError:
+            return None
+
+        if not lines or lines[0].split() != [
+            self.MANIFEST_MAGIC,
+            str(self.MANIFEST_VERSION),
+        ]:
+            logger.warning(
+                f"ignoring unknown stock manifest {self.path_manifest}"
+            )
+            return None
+
+        manifest = {}
+        for line in lines[1:]:
+            fields = line.split("\t")
+            if len(fields) != 4:
+                logger.warning(
+                    f"ignoring corrupt stock manifest {self.path_manifest}"
+                )
+                return None
+            name, kind, link, branch = fields
+            manifest[name] = ManifestEntry(
+                kind, link, None if branch == "-" else branch
+            )
+        return manifest
+
+    def _write_manifest(self) -> None:
+        """atomically write the manifest of the loaded stocks"""
+        lines = [f"{self.MANIFEST_MAGIC} {self.MANIFEST_VERSION}\n"]
+        for name, stock in self.stocks.items():
+            if isinstance(stock, StockPool):
+                entry = ManifestEntry("pool", stock.link)
+            else:
+                entry = ManifestEntry(
+                    "git" if stock.branch else "plain",
+                    stock.link,
+                    stock.branch,
+                )
+            fields = [name, *(field or "-" for field in entry)]
+            lines.append("\t".join(fields) + "\n")
+
+        fd, tmp_path = tempfile.mkstemp(
+            dir=dirname(self.path_manifest), prefix=".stocks.manifest."
+        )
+        with os.fdopen(fd, "w") as fob:
+            fob.writelines(lines)
+        os.replace(tmp_path, self.path_manifest)
+
+    def _add_stock(self, stock: StockBase) -> None:
+        self.stocks[stock.name] = stock
+        if isinstance(stock, StockPool):
+            self.subpools[stock.name] = stock
+        self._names = None
+        self._loads += 1
+
+    def _load_manifest_stock(
+        self, path_stock: str, entry: ManifestEntry
+    ) -> None:
+        logger.debug(f"loading {entry.kind} stock from {path_stock}")
+        stock: StockBase
+        try:
+            if entry.kind == "pool":
+                stock = StockPool(path_stock, self.recursed_paths, entry.link)
+            else:
+                stock = Stock(
+                    path_stock,
+                    self.pkgcache,
+                    self.git,
+                    entry.link,
+                    entry.branch,
+                )
+        except CircularDependency:
+            raise
+        except (StockError, StockBase.StockBaseError) as e:
+            logger.warning(f"failed to load stock {path_stock}: {e}")
+            return
+        self._add_stock(stock)
+
     def _load_stock(self, path_stock: AnyPath) -> None:
+        """load the stock at <path_stock>, probing for its type"""
         logger.debug(f"loading stock from {path_stock}")
         stock: StockBase | None = None
         try:
             stock = StockPool(path_stock, self.recursed_paths)
-            self.subpools[stock.name] = stock.pool
         except CircularDependency:
             raise
         except (StockError, PoolError):
@@ -609,40 +2133,73 @@ class Stocks:
         if not stock:
             logger.info("trying from package cache...")
             try:
-                stock = Stock(path_stock, self.pkgcache)
+                stock = Stock(path_stock, self.pkgcache, self.git)
             except StockError:
                 logger.warning(
                     "failed to get stock from package cache, ignoring..."
                 )
                 return
         if stock:
-            self.stocks[stock.name] = stock
+            self._add_stock(stock)
 
     def _load_stocks(self) -> None:
+        """load the registered stocks as recorded in the stock manifest.
+
+        Stocks are only probed for their type if there's no manifest yet or
+        it doesn't match the stock directories (e.g., they were registered
+        by an older version of pool), and the manifest is then rewritten.
+        """
         logger.debug("loading stocks")
         self.stocks: dict[str, StockBase] = {}
-        self.subpools: dict[str, PoolKernel] = {}
+        # subpool placeholders - see StockPool
+        self.subpools: dict[str, StockPool] = {}
+        self._names = None
+        self._loads += 1
+
+        with os.scandir(self.path) as entries:
+            stock_names = [entry.name for entry in entries if entry.is_dir()]
+
+        manifest = self._read_manifest()
+        if manifest is not None and set(manifest) == set(stock_names):
+            for stock_name, entry in manifest.items():
+                self._load_manifest_stock(join(self.path, stock_name), entry)
+            return
 
-        for stock_name in os.listdir(self.path):
+        for stock_name in stock_names:
             path_stock = join(self.path, stock_name)
-            if not isdir(path_stock):
-                logging.debug(f"ignoring non-stock {path_stock}")
-                continue
-
             logging.info(f"loading {path_stock}")
             self._load_stock(path_stock)
+        try:
+            self._write_manifest()
+        except OSError as e:
+            # e.g., a pool we can read but not write
+            logger.warning(f"can't write stock manifest: {e}")
 
     def __init__(
         self,
         path: AnyPath,
         pkgcache: PackageCache,
         recursed_paths: list[str] | None = None,
+        git: GitSessions | None = None,
+        path_manifest: str | None = None,
     ) -> None:
+        """<path_manifest> defaults to stocks.manifest next to <path>"""
         if recursed_paths is None:
             recursed_paths = []
         self.path = path
+        if path_manifest is None:
+            path_manifest = join(dirname(str_path(path)), "stocks.manifest")
+        self.path_manifest = path_manifest
         self.pkgcache = pkgcache
         self.recursed_paths = recursed_paths
+        self.git = GitSessions() if git is None else git
+
+        # source package name -> [(stock, path, versions), ...] in stock
+        # order, built on first lookup (see _name_index)
+        self._names: NameIndex | None = None
+        self._stock_names: dict[str, set[str]] = {}
+        self._stock_generations: dict[str, int] = {}
+        self._loads = 0
 
         self._load_stocks()
 
@@ -712,6 +2269,7 @@ class Stocks:
         stock_path = join(self.path, stock_name)
         Stock.create(stock_path, src_dir)
         self._load_stock(stock_path)
+        self._write_manifest()
         stock_src = "#".join([src_dir, branch]) if branch else src_dir
         print(f"registered stock: {stock_src}")
 
@@ -741,6 +2299,8 @@ class Stocks:
         stock = matches[0]
 
         del self.stocks[stock.name]
+        self._names = None
+        self._loads += 1
         if isinstance(stock, StockPool):
             del self.subpools[stock.name]
         else:
@@ -753,78 +2313,470 @@ class Stocks:
                 if error:
                     raise PoolError(f"failed command: {command}")
 
-            # remove cached binaries compiled from this stock
-            blacklist: set[tuple[str, str]] = set()
-            for path, versions in stock.sources:
-                name = basename(path)
-                blacklist |= {(name, version) for version in versions}
+            # remove cached binaries compiled from this stock
+            blacklist: set[tuple[str, str]] = set()
+            for path, versions in stock.sources:
+                name = basename(path)
+                blacklist |= {(name, version) for version in versions}
+
+            blacklist |= {
+                parse_package_filename(basename(path))
+                for path in stock.binaries
+            }
+
+            removelist = set(self.pkgcache.list()) & blacklist
+            for name, version in removelist:
+                self.pkgcache.remove(name, version)
+
+        shutil.rmtree(stock.path_root)
+        self._write_manifest()
+
+        branch = stock.branch if branch is None else branch
+        stock_src = "#".join([src_dir, branch]) if branch else src_dir
+        print(f"unregistered stock: {stock_src}")
+
+    def sync(self, jobs: int = 1) -> None:
+        """sync all non-subpool stocks, within a budget of <jobs> workers.
+
+        The budget is split between the two levels: up to <jobs> stocks are
+        synced at a time, and whatever is left over for each stock goes to
+        versioning its source packages concurrently - so a single stock gets
+        all <jobs> workers, and at most <jobs> are ever busy.
+
+        A stock failing to sync doesn't stop the others. Errors are collected
+        and raised once all stocks are done.
+        """
+        errors: dict[str, Exception] = {}
+        stocks = list(self)
+        parallel = max(1, min(jobs, len(stocks)))
+        stock_jobs = max(1, jobs // parallel)
+        if parallel == 1:
+            for stock in stocks:
+                try:
+                    stock.sync(stock_jobs)
+                except Exception as e:
+                    errors[stock.name] = e
+        else:
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                futures = {
+                    executor.submit(stock.sync, stock_jobs): stock
+                    for stock in stocks
+                }
+                for future in as_completed(futures):
+                    e = future.exception()
+                    if isinstance(e, Exception):
+                        errors[futures[future].name] = e
+                    elif e is not None:
+                        raise e
+
+        # pick up whatever was re-indexed (even if some stocks failed)
+        if self._names is not None:
+            for stock in self:
+                if stock.generation != self._stock_generations[stock.name]:
+                    self._index_stock(stock)
+
+        if len(errors) == 1:
+            raise next(iter(errors.values()))
+        if errors:
+            raise StockError(
+                f"failed to sync {len(errors)} stocks:\n"
+                + "\n".join(
+                    f"  {name}: {error}"
+                    for name, error in sorted(errors.items())
+                )
+            )
+
+    def is_fresh(self) -> bool:
+        """Cheaply check that syncing wouldn't change any stock"""
+        for stock in self:
+            try:
+                if not stock.is_fresh():
+                    logger.debug(f"stock {stock.name} is stale")
+                    return False
+            except Exception as e:
+                logger.debug(f"stock {stock.name} freshness unknown: {e}")
+                return False
+        return True
+
+    def _index_stock(self, stock: StockBase) -> None:
+        """(re)index the source packages of <stock> by name"""
+        index = self._names
+        assert index is not None
+        for name in self._stock_names.pop(stock.name, set()):
+            entries = [entry for entry in index[name] if entry[0] is not stock]
+            if entries:
+                index[name] = entries
+            else:
+                del index[name]
+
+        names = set()
+        for path, versions in stock.sources:
+            name = basename(path)
+            index.setdefault(name, []).append(
+                (stock, path, frozenset(versions))
+            )
+            names.add(name)
+
+        # keep entries in stock order, so the first match wins as before
+        order = {name: i for i, name in enumerate(self.stocks)}
+        for name in names:
+            index[name].sort(key=lambda entry: order[entry[0].name])
+
+        self._stock_names[stock.name] = names
+        self._stock_generations[stock.name] = stock.generation
+
+    def _name_index(self) -> NameIndex:
+        """Return the source package name index, building it if needed.
+
+        Built once per load and updated for the stocks that were re-indexed
+        by each sync."""
+        if self._names is None:
+            self._names = {}
+            self._stock_names = {}
+            self._stock_generations = {}
+            for stock in self:
+                self._index_stock(stock)
+        return self._names
+
+    def get_source_path(self, name: str, version: str) -> str | None:
+        """Return path of source package"""
+        for stock, path, versions in self._name_index().get(name, []):
+            if version in versions:
+                wd = stock.workdir
+                assert wd is not None
+                return join(wd, dirname(path))
+        return None
+
+    def exists_source_version(
+        self, name: str, version: str | None = None
+    ) -> bool:
+        """Returns true if the package source exists in any of the stocks.
+        If version is None (default), any version will match"""
+        entries = self._name_index().get(name, [])
+        if version is None:
+            return bool(entries)
+        return any(version in versions for _, _, versions in entries)
+
+    def get_subpools(self) -> list["PoolKernel"]:
+        """Returns the kernels of all subpools, loading them if needed"""
+        return [subpool.pool for subpool in self.subpools.values()]
+
+    @property
+    def generation(self) -> tuple[int, int]:
+        """Changes whenever stocks are loaded, (un)registered or
+        re-indexed"""
+        return self._loads, sum(stock.generation for stock in self)
+
+    def __str__(self) -> str:
+        str_list = []
+        for key, value in self.stocks.items():
+            str_list.append(f"{key}: {value}")
+        return "\n".join(str_list)
+
+
+class Resolution(NamedTuple):
+    """What a requested package resolved to (see PoolKernel.resolve_many).
+
+    <package> is None if the request doesn't exist in the pool. Otherwise
+    it's either in a package cache (<cache_path>) or has to be built from
+    source (<source_path>). <subpool> is the path of the (innermost) subpool
+    it was found in, or None if it's in the pool itself.
+    """
+
+    request: str
+    package: str | None = None
+    cache_path: str | None = None
+    source_path: str | None = None
+    subpool: str | None = None
+
+
+# (name, version) -> (cache path, source path, subpool path)
+Locations = dict[tuple[str, str], tuple[str | None, str | None, str | None]]
+
+# name -> {version: (cache path, subpool path)}; a cache path of None means
+# the package is built from a stock of the pool at subpool path (or of the
+# pool itself if that is None)
+PackageIndex = dict[str, dict[str, tuple[str | None, str | None]]]
+
+
+class FederatedIndex:
+    """Read-only merged index of the packages of a pool and its subpools.
+
+    Looking a package up is a single probe of <packages>, where each package
+    version appears with the location getpath_deb would get it from: the
+    pool's package cache first, then its subpools (in order), then its
+    stocks.
+
+    The index is built from slices - the package cache, the stocks and each
+    subpool's own federated index. Each slice is tagged with the generation
+    it was built from and only rebuilt when that generation changes, so a
+    change in one subpool only invalidates that subpool's slice.
+
+    A subpool is synced (see PoolKernel.sync_stale) the first time the index
+    refreshes it and after that only when another process synced it since,
+    so a lookup doesn't check the stocks of the whole subpool tree.
+    """
+
+    def __init__(self, kernel: "PoolKernel") -> None:
+        self.kernel = kernel
+        self.generation: Any = None
+        self.packages: PackageIndex = {}
+        # pool path -> kernel, for the pool and all of its subpools
+        self.kernels: dict[str, PoolKernel] = {}
+        self._newest: dict[str, str] | None = None
+        self._invalid: list[tuple[str, str]] = []
+        # slice key -> (generation, packages)
+        self._slices: dict[str, tuple[Any, PackageIndex]] = {}
+        # subpool path -> its sync epoch when we last synced it
+        self._synced: dict[str, float | None] = {}
+
+    def _slice(
+        self, key: str, generation: Any, build: Callable[[], PackageIndex]
+    ) -> PackageIndex:
+        cached = self._slices.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        logger.debug(f"FederatedIndex({self.kernel.path}): rebuilding {key}")
+        packages = build()
+        self._slices[key] = (generation, packages)
+        return packages
+
+    def _cache_slice(self) -> PackageIndex:
+        pkgcache = self.kernel.pkgcache
+        packages: PackageIndex = {}
+        for name, version in pkgcache.list():
+            packages.setdefault(name, {})[version] = (
+                pkgcache.getpath(name, version),
+                None,
+            )
+        return packages
+
+    def _stocks_slice(self) -> PackageIndex:
+        packages: PackageIndex = {}
+        for stock in self.kernel.stocks:
+            for path, versions in stock.sources:
+                name_versions = packages.setdefault(basename(path), {})
+                for version in versions:
+                    name_versions.setdefault(version, (None, None))
+        return packages
+
+    @staticmethod
+    def _subpool_slice(index: "FederatedIndex") -> PackageIndex:
+        path = index.kernel.path
+        return {
+            name: {
+                version: (cache_path, subpool or path)
+                for version, (cache_path, subpool) in versions.items()
+            }
+            for name, versions in index.packages.items()
+        }
+
+    def _subpool_index(self, subpool: "PoolKernel") -> "FederatedIndex":
+        path = subpool.path
+        if path in self._synced and self._synced[path] == subpool.sync_epoch:
+            with subpool.lock.shared():
+                return subpool._federated_index.refresh()
+        index = subpool.federated_index()
+        self._synced[path] = subpool.sync_epoch
+        return index
+
+    def refresh(self) -> "FederatedIndex":
+        """bring the index up to date (if needed) and return it"""
+        kernel = self.kernel
+        subpool_indexes = [
+            self._subpool_index(subpool) for subpool in kernel.subpools
+        ]
+        generation = (
+            kernel.pkgcache.generation,
+            kernel.stocks.generation,
+            tuple(
+                (index.kernel.path, index.generation)
+                for index in subpool_indexes
+            ),
+        )
+        if generation == self.generation:
+            return self
+
+        slices = [self._slice("cache", generation[0], self._cache_slice)]
+        kernels = {kernel.path: kernel}
+        for index in subpool_indexes:
+            kernels.update(index.kernels)
+            slices.append(
+                self._slice(
+                    index.kernel.path,
+                    index.generation,
+                    lambda index=index: self._subpool_slice(index),
+                )
+            )
+        slices.append(
+            self._slice("stocks", generation[1], self._stocks_slice)
+        )
+        for key in set(self._slices) - {"cache", "stocks", *kernels}:
+            del self._slices[key]
+
+        packages: PackageIndex = {}
+        for packages_slice in slices:
+            for name, versions in packages_slice.items():
+                merged = packages.setdefault(name, {})
+                for version, location in versions.items():
+                    merged.setdefault(version, location)
+
+        self.packages = packages
+        self.kernels = kernels
+        self.generation = generation
+        self._newest = None
+        return self
+
+    def get(
+        self, name: str, version: str
+    ) -> tuple[str | None, str | None] | None:
+        """Returns (cache path, subpool path) of package <name>=<version> or
+        None if it isn't in the pool"""
+        versions = self.packages.get(name)
+        if versions is None:
+            return None
+        return versions.get(version)
+
+    def newest(self) -> dict[str, str]:
+        """Returns {name: newest version}. Invalid versions are skipped and
+        listed in .invalid"""
+        if self._newest is None:
+            newest: dict[str, str] = {}
+            invalid = []
+            for name, versions in self.packages.items():
+                keyed = []
+                for version in versions:
+                    try:
+                        keyed.append((version_key(version), version))
+                    except ValueError:
+                        invalid.append((name, version))
+                if keyed:
+                    newest[name] = max(keyed)[1]
+            self._newest = newest
+            self._invalid = invalid
+        return self._newest
 
-            blacklist |= {
-                parse_package_filename(basename(path))
-                for path in stock.binaries
-            }
+    @property
+    def invalid(self) -> list[tuple[str, str]]:
+        self.newest()
+        return self._invalid
 
-            removelist = set(self.pkgcache.list()) & blacklist
-            for name, version in removelist:
-                self.pkgcache.remove(name, version)
 
-        shutil.rmtree(stock.path_root)
+class PoolLock:
+    """Reader/writer lock of a pool, shared by all processes using it.
 
-        branch = stock.branch if branch is None else branch
-        stock_src = "#".join([src_dir, branch]) if branch else src_dir
-        print(f"unregistered stock: {stock_src}")
+    Lookups hold it shared while syncs, register, unregister and gc hold it
+    exclusively, so a reader never sees a stock index or the package cache
+    half way through being rebuilt. It's an flock(2) on the pool's lock
+    file.
 
-    def sync(self) -> None:
-        """sync all non-subpool stocks"""
-        for stock in self:
-            stock.sync()
+    Within a process there's one instance per pool (see get) and it's
+    reentrant: a nested hold is a no-op, and an exclusive hold covers nested
+    shared ones. A shared hold can't be upgraded.
+    """
 
-    def get_source_path(self, name: str, version: str) -> str | None:
-        """Return path of source package"""
-        for stock in self:
-            for path, versions in stock.sources:
-                if basename(path) == name and version in versions:
-                    wd = stock.workdir
-                    assert wd is not None
-                    return join(wd, dirname(path))
-        return None
+    _locks: dict[str, "PoolLock"] = {}
+    _locks_lock = threading.Lock()
 
-    def exists_source_version(
-        self, name: str, version: str | None = None
-    ) -> bool:
-        """Returns true if the package source exists in any of the stocks.
-        If version is None (default), any version will match"""
+    @classmethod
+    def get(cls, path: str) -> "PoolLock":
+        """Returns the lock for the lock file at <path>"""
+        path = realpath(path)
+        with cls._locks_lock:
+            if path not in cls._locks:
+                cls._locks[path] = cls(path)
+            return cls._locks[path]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.mode: int | None = None
+        self.depth = 0
+        self.lock = threading.RLock()
 
-        for stock in self:
-            for path, versions in stock.sources:
-                if basename(path) == name:
-                    if version is None:
-                        return True
+    @property
+    def held(self) -> bool:
+        return self.depth > 0
 
-                    if version in versions:
-                        return True
+    def _open(self) -> int | None:
+        try:
+            return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        except PermissionError:
+            pass
+        try:
+            # flock works on read-only descriptors too
+            return os.open(self.path, os.O_RDONLY)
+        except OSError as e:
+            logger.warning(f"not locking pool - can't open {self.path}: {e}")
+            return None
 
-        return False
+    @contextmanager
+    def _hold(self, mode: int) -> Generator[None]:
+        with self.lock:
+            if self.depth:
+                if mode == fcntl.LOCK_EX and self.mode != fcntl.LOCK_EX:
+                    raise PoolError(f"can't upgrade shared lock {self.path}")
+                self.depth += 1
+                try:
+                    yield
+                finally:
+                    self.depth -= 1
+                return
 
-    def get_subpools(self) -> list["PoolKernel"]:
-        return list(self.subpools.values())
+            fd = self._open()
+            try:
+                if fd is not None:
+                    if not self._try_lock(fd, mode):
+                        logger.info(f"waiting for pool lock {self.path}")
+                        fcntl.flock(fd, mode)
+                self.mode = mode
+                self.depth = 1
+                try:
+                    yield
+                finally:
+                    self.depth = 0
+                    self.mode = None
+            finally:
+                # closing the descriptor releases the lock
+                if fd is not None:
+                    os.close(fd)
 
-    def __str__(self) -> str:
-        str_list = []
-        for key, value in self.stocks.items():
-            str_list.append(f"{key}: {value}")
-        return "\n".join(str_list)
+    @staticmethod
+    def _try_lock(fd: int, mode: int) -> bool:
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def shared(self) -> AbstractContextManager[None]:
+        return self._hold(fcntl.LOCK_SH)
+
+    def exclusive(self) -> AbstractContextManager[None]:
+        return self._hold(fcntl.LOCK_EX)
 
 
 @no_type_check
-def sync(method):
+def _synced(exclusive):
     @no_type_check
-    def wrapper(self, *args, **kws):
-        if self.autosync:
-            self.sync()
-        return method(self, *args, **kws)
+    def decorator(method):
+        @no_type_check
+        def wrapper(self, *args, **kws):
+            # nested calls are covered by the outermost one's sync
+            if self.autosync and not self.lock.held:
+                self.sync_stale()
+            hold = self.lock.exclusive if exclusive else self.lock.shared
+            with hold():
+                return method(self, *args, **kws)
+
+        return wrapper
 
-    return wrapper
+    return decorator
+
+
+# sync the pool if needed, then call the method holding the pool lock shared
+sync = _synced(exclusive=False)
+# ... or exclusively, for methods that change the pool
+sync_exclusive = _synced(exclusive=True)
 
 
 class PoolKernel:
@@ -840,6 +2792,16 @@ class PoolKernel:
             return obj.stocks.get_subpools()
 
     subpools = Subpools()
+    sync_epoch = _SyncEpoch()
+
+    def subpool_status(self) -> list[tuple[str, float | None, bool]]:
+        """Returns (path, time of last sync, package cache indexed) of each
+        registered subpool, as recorded on disk, without loading any of
+        them"""
+        return [
+            (subpool.path, subpool.synced, subpool.indexed)
+            for subpool in self.stocks.subpools.values()
+        ]
 
     @staticmethod
     def parse_package_id(package: str) -> tuple[str, str | None]:
@@ -874,17 +2836,40 @@ class PoolKernel:
         recursed_paths: list[str] | None = None,
         autosync: bool = True,
         preserve_buildroot: str | None = None,
+        jobs: int | None = None,
+        sync_max_age: float | None = None,
     ) -> None:
         """Initialize pool instance.
 
         if <autosync> is False, the user is expected to control syncing
         manually.
+
+        <jobs> is the maximum number of stocks synced in parallel (defaults
+        to $POOL_JOBS or 1).
+
+        <sync_max_age> is how many seconds a sync is trusted for before
+        autosync checks the stocks for changes again (defaults to
+        $POOL_SYNC_MAX_AGE or 0).
         """
 
         if recursed_paths is None:
             recursed_paths = []
         self.preserve_buildroot = preserve_buildroot
 
+        if jobs is None:
+            try:
+                jobs = int(os.getenv("POOL_JOBS", "1"))
+            except ValueError as e:
+                raise PoolError(f"invalid POOL_JOBS ({e})") from e
+        self.jobs = max(jobs, 1)
+
+        if sync_max_age is None:
+            try:
+                sync_max_age = float(os.getenv("POOL_SYNC_MAX_AGE", "0"))
+            except ValueError as e:
+                raise PoolError(f"invalid POOL_SYNC_MAX_AGE ({e})") from e
+        self.sync_max_age = sync_max_age
+
         if path is None:
             cwd = os.getcwd()
             path_env = os.getenv("POOL_DIR", cwd)
@@ -897,17 +2882,25 @@ class PoolKernel:
 
         spath = join(realpath(spath), ".pool")
         self.path_pkgcache = join(spath, "pkgcache")
+        self.path_pkgcache_index = join(spath, "pkgcache.index")
+        self.path_pkgcache_control = join(spath, "pkgcache.control")
+        self.path_pkgcache_access = join(spath, "pkgcache.access")
         self.path_stocks = join(spath, "stocks")
+        self.path_stocks_manifest = join(spath, "stocks.manifest")
+        self.path_sync_epoch = join(spath, "sync.epoch")
+        self.path_lock = join(spath, "lock")
         self.path_tmp = join(spath, "tmp")
         self.path_build_root = join(spath, "build/root")
         self.path_build_logs = join(spath, "build/logs")
         self.path_build_info = join(spath, "build/buildinfo")
         self.path_srcpkgcache = join(spath, "srcpkgcache")
+        self.path_store = join(spath, "store")
 
         self.full_path = spath
         self.path = dirname(spath)
         if not exists(spath):
             raise PoolError(f"no pool found (POOL_DIR={self.path})")
+        self.lock = PoolLock.get(self.path_lock)
 
         self.buildroot: str | None
         if islink(self.path_build_root):
@@ -915,10 +2908,29 @@ class PoolKernel:
         else:
             self.buildroot = None
 
-        self.pkgcache = PackageCache(self.path_pkgcache)
+        self.store: PackageStore | None
+        if islink(self.path_store):
+            self.store = PackageStore(os.readlink(self.path_store))
+        else:
+            self.store = None
+
+        self.pkgcache = PackageCache(
+            self.path_pkgcache,
+            self.path_pkgcache_index,
+            self.path_pkgcache_control,
+            self.store,
+            self.path_pkgcache_access,
+        )
+        # git processes reused by all stocks for the life of the kernel
+        self.git = GitSessions()
         self.stocks = Stocks(
-            self.path_stocks, self.pkgcache, [*recursed_paths, self.path]
+            self.path_stocks,
+            self.pkgcache,
+            [*recursed_paths, self.path],
+            self.git,
+            self.path_stocks_manifest,
         )
+        self._federated_index = FederatedIndex(self)
         mkdir(self.path_tmp)
         self.autosync = autosync
 
@@ -929,65 +2941,73 @@ class PoolKernel:
             str_lines.append(f"  {stock}")
         return "\n".join(str_lines)
 
+    def close(self) -> None:
+        """stop the git processes of the pool and of its loaded subpools"""
+        self.git.close()
+        for subpool in self.stocks.subpools.values():
+            if subpool._pool is not None:
+                subpool._pool.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
     def register(self, stock: str) -> None:
-        self.stocks.register(stock)
+        with self.lock.exclusive():
+            self.stocks.register(stock)
+            self.sync_epoch = None
 
     def unregister(self, stock: str) -> None:
-        self.stocks.unregister(stock)
+        with self.lock.exclusive():
+            self.stocks.unregister(stock)
+            self.sync_epoch = None
+
+    @sync
+    def federated_index(self) -> FederatedIndex:
+        """Returns the up to date federated index of the packages of this
+        pool and its subpools"""
+        return self._federated_index.refresh()
 
     @sync
     def exists(self, package: str) -> bool:
         """Check if package exists in pool -> Returns bool"""
 
         name, version = self.parse_package_id(package)
+        # <name> may also be the filename of a cached package
         if self.pkgcache.exists(name, version):
             return True
-
-        if self.stocks.exists_source_version(name, version):
-            return True
-
-        for subpool in self.subpools:
-            if subpool.exists(package):
-                return True
-
-        return False
+        index = self._federated_index.refresh()
+        if version is None:
+            return name in index.packages
+        return index.get(name, version) is not None
 
     @sync
     def _list(
         self, all_versions: bool, verbose: bool = False
     ) -> list[tuple[str, str]]:
         """List packages in pool -> list of (name, version) tuples."""
-        packages: set[tuple[str, str]] = set()
-        for subpool in self.subpools:
-            packages |= set(subpool._list(all_versions))
-
-        packages |= set(self.pkgcache.list())
-        for stock in self.stocks:
-            for path, versions in stock.sources:
-                package = basename(path)
-                packages |= {(package, version) for version in versions}
-
+        index = self._federated_index.refresh()
         if all_versions:
-            return list(packages)
+            return [
+                (name, version)
+                for name, versions in index.packages.items()
+                for version in versions
+            ]
 
-        newest: dict[str, str] = {}
-        for name, version in packages:
-            try:
-                if (
-                    name not in newest
-                    or debian_support.version_compare(
-                        newest[name], version
-                    ) < 0
-                ):
-                    newest[name] = version
-            except ValueError as e:
-                if verbose:
-                    print(
-                        f"Warning: skipping {name} {version} - {e}",
-                        file=sys.stderr,
-                    )
-                else:
-                    pass
+        newest = index.newest()
+        if verbose:
+            for name, version in index.invalid:
+                print(
+                    f"Warning: skipping {name} {version} - invalid version",
+                    file=sys.stderr,
+                )
 
         return list(newest.items())
 
@@ -1024,6 +3044,7 @@ class PoolKernel:
             args = unresolved
 
         packages = dict(self._list(all_versions=False))
+        logger.debug(repr(packages))
         resolved = []
 
         for arg in args:
@@ -1035,7 +3056,6 @@ class PoolKernel:
                         f"can't resolve non-existent package `{name}'"
                     )
                 version = packages[name]
-            logger.debug(repr(packages))
             logger.debug(f"resolve {name=} {version=}")
 
             resolved.append(self.fmt_package_id(name, version))
@@ -1045,9 +3065,105 @@ class PoolKernel:
 
         return resolved
 
+    def _locate(self, packages: Iterable[tuple[str, str]]) -> Locations:
+        """Find where each of (name, version) <packages> is.
+
+        Looks in the same order getpath_deb does: the package cache, then
+        subpools, then the stocks. Packages that aren't anywhere are left
+        out of the result.
+        """
+        located: Locations = {}
+        pending = []
+        for package in packages:
+            # the package cache comes first, and doesn't need subpools
+            path = self.pkgcache.getpath(*package)
+            if path:
+                located[package] = (path, None, None)
+            else:
+                pending.append(package)
+        if not pending:
+            return located
+
+        index = self._federated_index.refresh()
+        for package in pending:
+            location = index.get(*package)
+            if location is None:
+                continue
+            path, subpool = location
+            if path:
+                located[package] = (path, None, subpool)
+                continue
+            kernel = index.kernels[subpool or self.path]
+            source_path = kernel.stocks.get_source_path(*package)
+            if source_path:
+                located[package] = (None, source_path, subpool)
+
+        return located
+
+    @sync
+    def resolve_many(self, packages: Iterable[str]) -> List[Resolution]:
+        """Resolve and locate <packages> (name or name=version) in one pass.
+
+        Packages without a version resolve to the newest version in the
+        pool. Returns a Resolution for each package, in order.
+        """
+        requests = [
+            (package, *self.parse_package_id(package)) for package in packages
+        ]
+        newest: dict[str, str] = {}
+        if any(version is None for _, _, version in requests):
+            newest = dict(self._list(all_versions=False))
+
+        wanted: dict[str, tuple[str, str] | None] = {}
+        for request, name, version in requests:
+            if version is None:
+                version = newest.get(name)
+            wanted[request] = None if version is None else (name, version)
+
+        located = self._locate(
+            dict.fromkeys(
+                package for package in wanted.values() if package is not None
+            )
+        )
+
+        resolutions = []
+        for request, _, _ in requests:
+            package = wanted[request]
+            if package is None or package not in located:
+                resolutions.append(Resolution(request))
+                continue
+            resolutions.append(
+                Resolution(
+                    request, self.fmt_package_id(*package), *located[package]
+                )
+            )
+        return resolutions
+
+    def touch_many(self, resolutions: Iterable[Resolution]) -> None:
+        """Record that the cached packages of <resolutions> were used"""
+        kernels = {self.path: self}
+        for resolution in resolutions:
+            if resolution.package is None or resolution.cache_path is None:
+                continue
+            if resolution.subpool and resolution.subpool not in kernels:
+                kernels = self._federated_index.refresh().kernels
+            kernels[resolution.subpool or self.path].pkgcache.touch(
+                *self.parse_package_id(resolution.package)
+            )
+
     def _build_package_source(
-        self, source_path: str, name: str, version: str, source: bool = False
+        self,
+        source_path: str,
+        name: str,
+        version: str,
+        source: bool = False,
+        log: TextIO | None = None,
     ) -> None:
+        """build <name>=<version> from <source_path> and import the results.
+
+        Output goes to <log> if given, otherwise to stdout. Not safe to run
+        concurrently on the same source tree (see _source_tree).
+        """
         if self.buildroot is None:
             raise PoolError(
                 "Cannot build a package in a pool without a buildroot"
@@ -1059,8 +3175,8 @@ class PoolKernel:
 
         package = self.fmt_package_id(name, version)
 
-        print(f"### BUILDING PACKAGE: {package}")
-        print(f"###           SOURCE: {source_path}")
+        print(f"### BUILDING PACKAGE: {package}", file=log)
+        print(f"###           SOURCE: {source_path}", file=log)
 
         # seek to version, build the package, seek back
         verseek.seek_version(source_path, version)
@@ -1074,21 +3190,26 @@ class PoolKernel:
         build_env = read_pkg_deckdebuild_env(
             join(source_path, "DECKDEBUILD_ENV")
         )
-        with in_dir(source_path):
-            command = [
-                "/usr/bin/deckdebuild",
-                *args,
-                self.buildroot,
-                build_outputdir,
-            ]
-            print(
-                f"# {' '.join(command)} (DECKDEBUILD_ENV: {build_env})"
-            )
-            # run deckdebuild with full env
-            build_env |= os.environ.copy()
-            deckdebuild_exitcode = subprocess.run(
-                command, env=build_env
-            ).returncode
+        command = [
+            "/usr/bin/deckdebuild",
+            *args,
+            self.buildroot,
+            build_outputdir,
+        ]
+        print(
+            f"# {' '.join(command)} (DECKDEBUILD_ENV: {build_env})", file=log
+        )
+        if log is not None:
+            log.flush()
+        # run deckdebuild with full env
+        build_env |= os.environ.copy()
+        deckdebuild_exitcode = subprocess.run(
+            command,
+            env=build_env,
+            cwd=source_path,
+            stdout=log,
+            stderr=None if log is None else subprocess.STDOUT,
+        ).returncode
         verseek.seek_version(source_path)
 
         if deckdebuild_exitcode != 0:
@@ -1099,14 +3220,15 @@ class PoolKernel:
         elif self.preserve_buildroot == "never":
             shutil.rmtree(build_outputdir)
 
-        print()
+        print(file=log)
 
         # copy *.debs and build output from output dir
+        debs = []
         for fname in os.listdir(build_outputdir):
             fpath = join(build_outputdir, fname)
             fname_part, ext_part = splitext(fname)
             if splitext(fname)[1] in (".deb", ".udeb"):
-                self.pkgcache.add(fpath)
+                debs.append(fpath)
             elif fname.endswith(".build"):
                 shutil.copyfile(fpath, join(self.path_build_logs, fname))
             elif fname.endswith(".buildinfo"):
@@ -1116,9 +3238,156 @@ class PoolKernel:
                 and splitext(fname_part)[1] == ".tar"
             ):
                 shutil.copyfile(fpath, join(self.path_srcpkgcache, fname))
+        # under the package cache lock, so concurrent builds can import
+        self.pkgcache.add_many(debs, workers=1)
 
         shutil.rmtree(build_outputdir)
 
+    @staticmethod
+    def _source_tree(source_path: str) -> str:
+        """Returns the tree that building from <source_path> changes.
+
+        Building seeks the source to the version being built, which checks
+        out a different commit of the whole git repository it's in - e.g., a
+        git stock's checkout - so that's the unit builds are serialized on.
+        """
+        path = source_path
+        while dirname(path) != path:
+            if exists(join(path, ".git")):
+                return path
+            path = dirname(path)
+        return source_path
+
+    def _build_package(
+        self,
+        source_path: str,
+        package: str,
+        source: bool = False,
+        logged: bool = False,
+    ) -> str:
+        """build <package> (name=version) from <source_path> -> path to the
+        cached binary.
+
+        If <logged>, build output goes to a log in the pool's tmp directory
+        instead of stdout. The log is removed if the build succeeds.
+        """
+        name, version = self.parse_package_id(package)
+        assert version is not None
+        if not logged:
+            self._build_package_source(source_path, name, version, source)
+        else:
+            fd, path_log = tempfile.mkstemp(
+                dir=self.path_tmp, prefix=f"{name}-{version}.", suffix=".log"
+            )
+            print(f"### BUILDING PACKAGE: {package} (log: {path_log})")
+            with os.fdopen(fd, "w") as log:
+                try:
+                    self._build_package_source(
+                        source_path, name, version, source, log
+                    )
+                except Exception:
+                    print(f"### FAILED: {package} (log: {path_log})")
+                    raise
+            os.remove(path_log)
+
+        path = self.pkgcache.getpath(name, version)
+        if not path:
+            raise PoolError(
+                f"recently built package `{package}' missing from cache"
+            )
+        self.pkgcache.touch(name, version)
+        return path
+
+    @sync
+    def build_many(
+        self,
+        packages: Iterable[str],
+        source: bool = False,
+        jobs: int | None = None,
+        stop_on_error: bool = False,
+    ) -> tuple[dict[str, str], dict[str, str]]:
+        """Get the paths to <packages> (name=version), building the ones that
+        aren't cached, up to <jobs> (defaults to the pool's jobs) at a time.
+
+        Builds from the same source tree (see _source_tree) run one after
+        the other, in order. With more than one job each build's output goes
+        to its own log (see _build_package). If <stop_on_error>, no more
+        builds are started once one fails.
+
+        Returns ({package: path}, {package: error}). Packages that weren't
+        built because of <stop_on_error> are in neither.
+        """
+        jobs = self.jobs if jobs is None else max(jobs, 1)
+        paths: dict[str, str] = {}
+        errors: dict[str, str] = {}
+
+        index = self._federated_index.refresh()
+        # source tree -> [(kernel, package, source path), ...]
+        trees: dict[str, list[tuple[PoolKernel, str, str]]] = {}
+        for package in dict.fromkeys(packages):
+            name, version = self.parse_package_id(package)
+            location = None if version is None else index.get(name, version)
+            if location is None:
+                errors[package] = f"no such package `{package}'"
+                continue
+            path, subpool = location
+            kernel = index.kernels[subpool or self.path]
+            if path:
+                kernel.pkgcache.touch(name, version)
+                paths[package] = path
+                continue
+            source_path = kernel.stocks.get_source_path(name, version)
+            if not source_path:
+                errors[package] = f"no source for package `{package}'"
+                continue
+            trees.setdefault(self._source_tree(source_path), []).append(
+                (kernel, package, source_path)
+            )
+
+        failed = threading.Event()
+        logged = jobs > 1 and len(trees) > 1
+
+        def build_tree(builds: list[tuple[PoolKernel, str, str]]) -> None:
+            for kernel, package, source_path in builds:
+                if stop_on_error and failed.is_set():
+                    return
+                # an earlier build of the same source may have built it
+                name, version = self.parse_package_id(package)
+                assert version is not None
+                path = kernel.pkgcache.getpath(name, version)
+                if path:
+                    kernel.pkgcache.touch(name, version)
+                    paths[package] = path
+                    continue
+                try:
+                    paths[package] = kernel._build_package(
+                        source_path, package, source, logged
+                    )
+                except Exception as e:
+                    errors[package] = str(e) or repr(e)
+                    failed.set()
+
+        with ExitStack() as stack:
+            # subpools we build in mustn't change under us either
+            for kernel in {
+                kernel for builds in trees.values() for kernel, _, _ in builds
+            }:
+                if kernel is not self:
+                    stack.enter_context(kernel.lock.shared())
+
+            if not logged:
+                for builds in trees.values():
+                    build_tree(builds)
+            else:
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    for future in [
+                        executor.submit(build_tree, builds)
+                        for builds in trees.values()
+                    ]:
+                        future.result()
+
+        return paths, errors
+
     @sync
     def getpath_deb(
         self, package: str, build: bool = True, source: bool = False
@@ -1136,12 +3405,21 @@ class PoolKernel:
 
         path = self.pkgcache.getpath(name, version)
         if path:
+            self.pkgcache.touch(name, version)
             return path
 
-        for subpool in self.subpools:
-            path = subpool.getpath_deb(package, build, source)
-            if path:
-                return path
+        index = self._federated_index.refresh()
+        location = index.get(name, version)
+        if location is None:
+            return None
+
+        path, subpool = location
+        if subpool is not None:
+            return index.kernels[subpool].getpath_deb(package, build, source)
+
+        if path:
+            self.pkgcache.touch(name, version)
+            return path
 
         if not build:
             return None
@@ -1150,15 +3428,9 @@ class PoolKernel:
         if not source_path:
             return None
 
-        self._build_package_source(source_path, name, version, source)
-
-        path = self.pkgcache.getpath(name, version)
-        if not path:
-            raise PoolError(
-                f"recently built package `{package}' missing from cache"
-            )
-
-        return path
+        return self._build_package(
+            source_path, self.fmt_package_id(name, version), source
+        )
 
     class BuildLogs:
         def __get__(
@@ -1198,8 +3470,7 @@ class PoolKernel:
                     log_versions.append(log_version)
 
         if log_versions:
-            log_versions.sort(key=Version)
-            last_version = log_versions[-1]
+            last_version = max(log_versions, key=version_key)
 
             return get_log_path(name, last_version)
 
@@ -1210,20 +3481,66 @@ class PoolKernel:
 
         return None
 
-    @sync
-    def gc(self, recurse: bool = True, verbose: bool = True) -> None:
-        """Garbage collect stale data from the pool's caches"""
+    def _gc_evict(
+        self,
+        evictable: set[tuple[str, str]],
+        max_size: int | None,
+        max_age: float | None,
+        verbose: bool,
+    ) -> None:
+        """Evict <evictable> cached packages, least recently used first, until
+        the cache is no larger than <max_size> bytes and none of them was last
+        used more than <max_age> seconds ago."""
+        last_access = self.pkgcache.last_access()
+        entries = []
+        total_size = 0
+        for (name, version), filename in self.pkgcache.filenames.items():
+            size = os.stat(join(self.pkgcache.path, filename)).st_size
+            total_size += size
+            if (name, version) in evictable:
+                entries.append((last_access[filename], size, name, version))
+
+        now = time.time()
+        for timestamp, size, name, version in sorted(entries):
+            expired = max_age is not None and now - timestamp > max_age
+            oversize = max_size is not None and total_size > max_size
+            if not expired and not oversize:
+                # entries are sorted by age, the rest are newer
+                break
+            if verbose:
+                print(f"pkgcache: evicting {name}={version}")
+            self.pkgcache.remove(name, version)
+            total_size -= size
+
+    @sync_exclusive
+    def gc(
+        self,
+        recurse: bool = True,
+        verbose: bool = True,
+        max_size: int | None = None,
+        max_age: float | None = None,
+    ) -> None:
+        """Garbage collect stale data from the pool's caches
+
+        If <max_size> (bytes) or <max_age> (seconds) are set, also evict
+        cached packages that can be rebuilt from a source stock, least
+        recently used first, until the cache fits in <max_size> and contains
+        nothing unused for longer than <max_age>. Packages that come from a
+        binary stock are never evicted.
+        """
 
-        whitelist: set[tuple[str, str]] = set()
+        sources: set[tuple[str, str]] = set()
+        binaries: set[tuple[str, str]] = set()
         for stock in self.stocks:
             for path, versions in stock.sources:
                 name = basename(path)
-                whitelist |= {(name, version) for version in versions}
+                sources |= {(name, version) for version in versions}
 
-            whitelist |= {
+            binaries |= {
                 parse_package_filename(basename(path))
                 for path in stock.binaries
             }
+        whitelist = sources | binaries
 
         print(f"ignoring {len(whitelist)} whitelisted items")
         removelist = set(self.pkgcache.list()) - whitelist
@@ -1232,12 +3549,32 @@ class PoolKernel:
                 print(f"pkgcache: removing {name}={version}")
             self.pkgcache.remove(name, version)
 
+        if max_size is not None or max_age is not None:
+            self._gc_evict(sources - binaries, max_size, max_age, verbose)
+        self.pkgcache.compact_access_log()
+
+        # forget control fields of debs that are neither cached nor in a stock
+        control_paths = [
+            join(self.pkgcache.path, filename)
+            for filename in self.pkgcache.filenames.values()
+        ]
+        for stock in self.stocks:
+            if stock.workdir is None:
+                continue
+            control_paths += [
+                join(stock.workdir, path) for path in stock.binaries
+            ]
+        self.pkgcache.controls.prune(control_paths)
+
+        if self.store is not None:
+            self.store.gc(verbose)
+
         for stock in self.stocks:
             stock.sync_head = None
 
         if recurse:
             for subpool in self.subpools:
-                subpool.gc(recurse)
+                subpool.gc(recurse, max_size=max_size, max_age=max_age)
 
     def drop_privileges(self, pretend: bool = False) -> bool:
         """Set the uid and gid of the current process to that of the pool.
@@ -1260,7 +3597,45 @@ class PoolKernel:
 
     def sync(self) -> None:
         """synchronise pool with registered stocks"""
-        self.stocks.sync()
+        with self.lock.exclusive():
+            self.sync_epoch = None
+            self.stocks.sync(self.jobs)
+            self.sync_epoch = time.time()
+
+    def reload(self) -> None:
+        """pick up changes made to the pool by other processes"""
+        self.stocks.reload()
+        self.pkgcache.refresh()
+
+    def sync_stale(self) -> None:
+        """synchronise pool with registered stocks, unless it's known to be
+        in sync already.
+
+        That's the case if the last sync (the sync epoch) was less than
+        sync_max_age seconds ago, or if it completed and none of the stocks
+        changed since (see Stocks.is_fresh).
+
+        If another process is syncing the pool, we wait for it to finish and
+        reuse its result rather than syncing all over again.
+        """
+        epoch = self.sync_epoch
+        if epoch is not None:
+            age = time.time() - epoch
+            if 0 <= age < self.sync_max_age:
+                logger.debug(f"synced {age:.1f}s ago, skipping sync")
+                return
+            with self.lock.shared():
+                if self.stocks.is_fresh():
+                    logger.debug("stocks unchanged since last sync")
+                    return
+
+        with self.lock.exclusive():
+            current = self.sync_epoch
+            if current is not None and current != epoch:
+                logger.debug("pool was synced by another process")
+                self.reload()
+                return
+            self.sync()
 
 
 def get_treedir(pkgname: str) -> str:
@@ -1270,6 +3645,84 @@ def get_treedir(pkgname: str) -> str:
         return join(pkgname[:1], pkgname)
 
 
+class GlobMatcher:
+    """Match names against many globs in one pass.
+
+    Globs without wildcards are looked up in a dict. The others are compiled
+    once and grouped by their literal prefix (the part before the first
+    wildcard), so a name is only tested against the globs that could
+    possibly match it. Keeps track of which globs matched something.
+    """
+
+    WILDCARDS = re.compile(r"[*?[]")
+
+    def __init__(self, globs: Iterable[str]) -> None:
+        self.globs = list(globs)
+        self.matched: set[str] = set()
+        self.literals: set[str] = set()
+        # prefix -> (combined pattern, [(glob, pattern), ...])
+        self.wildcards: dict[
+            str, tuple[re.Pattern, list[tuple[str, re.Pattern]]]
+        ] = {}
+
+        grouped: dict[str, list[str]] = {}
+        for glob in dict.fromkeys(self.globs):
+            m = self.WILDCARDS.search(glob)
+            if m is None:
+                self.literals.add(glob)
+            else:
+                grouped.setdefault(glob[: m.start()], []).append(glob)
+
+        for prefix, prefix_globs in grouped.items():
+            regexes = [translate(glob) for glob in prefix_globs]
+            self.wildcards[prefix] = (
+                re.compile("|".join(regexes)),
+                [
+                    (glob, re.compile(regex))
+                    for glob, regex in zip(prefix_globs, regexes, strict=True)
+                ],
+            )
+        self.prefix_lengths = sorted({len(prefix) for prefix in grouped})
+
+    def match(self, name: str) -> bool:
+        """Returns True if <name> matches any of the globs"""
+        found = False
+        if name in self.literals:
+            self.matched.add(name)
+            found = True
+
+        for length in self.prefix_lengths:
+            if length > len(name):
+                break
+            group = self.wildcards.get(name[:length])
+            if group is None:
+                continue
+            combined, patterns = group
+            if not combined.match(name):
+                continue
+            found = True
+            # only globs that haven't matched anything yet need checking
+            for glob, pattern in patterns:
+                if glob not in self.matched and pattern.match(name):
+                    self.matched.add(glob)
+
+        return found
+
+    def filter(
+        self, items: Iterable[str], key: Callable[[str], str] | None = None
+    ) -> Iterator[str]:
+        """Yield the <items> (by <key>, if given) that match any of the
+        globs"""
+        for item in items:
+            if self.match(item if key is None else key(item)):
+                yield item
+
+    @property
+    def missing(self) -> list[str]:
+        """Globs that haven't matched anything (so far)"""
+        return [glob for glob in self.globs if glob not in self.matched]
+
+
 class Pool:
     PoolError = PoolError
 
@@ -1303,6 +3756,7 @@ class Pool:
         cls: type["Pool"],
         buildroot: AnyPath | None,
         path: AnyPath | None = None,
+        store: AnyPath | None = None,
     ) -> "Pool":
         if path is None:
             cwd = os.getcwd()
@@ -1319,6 +3773,7 @@ class Pool:
         path_build_logs = join(spath, "build/logs")
         path_build_info = join(spath, "build/buildinfo")
         path_srcpkgcache = join(spath, "srcpkgcache")
+        path_store = join(spath, "store")
 
         if isdir(spath):
             raise PoolError("pool already initialized")
@@ -1326,10 +3781,19 @@ class Pool:
         if buildroot is not None and not isdir(buildroot):
             raise PoolError(f"buildroot `{buildroot}' is not a directory")
 
+        if store is not None and not isdir(store):
+            raise PoolError(f"package store `{store}' is not a directory")
+
         mkdir(path_stocks)
         Git.set_gitignore(
             path_stocks,
-            ["index-sources", "index-binaries", "SYNC_HEAD", "checkout"],
+            [
+                "index",
+                "index-sources",
+                "index-binaries",
+                "SYNC_HEAD",
+                "checkout",
+            ],
         )
 
         mkdir(path_pkgcache)
@@ -1352,7 +3816,18 @@ class Pool:
         Git.anchor(path_build_info)
         Git.set_gitignore(path_build_info, ["*.buildinfo"])
 
-        Git.set_gitignore(spath, ["tmp"])
+        Git.set_gitignore(
+            spath,
+            [
+                "tmp",
+                "pkgcache.index",
+                "pkgcache.control",
+                "pkgcache.access",
+                "store",
+                "lock",
+                "sync.epoch",
+            ],
+        )
 
         # if set, symlink path_build_root -> buildroot, otherwise touch
         if buildroot is not None:
@@ -1360,14 +3835,21 @@ class Pool:
         else:
             open(path_build_root, "w").close()
 
+        # if set, symlink path_store -> shared package store
+        if store is not None:
+            os.symlink(abspath(store), path_store)
+
         return cls(path)
 
     def __init__(
         self,
         path: AnyPath | None = None,
         preserve_buildroot: str | None = "on-error",
+        jobs: int | None = None,
     ) -> None:
-        kernel = PoolKernel(path, preserve_buildroot=preserve_buildroot)
+        kernel = PoolKernel(
+            path, preserve_buildroot=preserve_buildroot, jobs=jobs
+        )
         if kernel.drop_privileges(pretend=True):
 
             def f() -> PoolKernel:
@@ -1382,6 +3864,20 @@ class Pool:
             )
         self.kernel = kernel
 
+    def close(self) -> None:
+        self.kernel.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
     def list(
         self, all_versions: bool = False, *globs: str, verbose: bool = False
     ) -> "Pool.PackageList":
@@ -1394,34 +3890,20 @@ class Pool:
         """
         assert isinstance(all_versions, bool)
 
-        def filter_packages(
-            packages: list[str] | Pool.PackageList, globs: list[str]
-        ) -> "Pool.PackageList":
-            filtered = Pool.PackageList()
-            for glob in globs:
-                matches = []
-                for package in packages:
-                    name, _ = Pool.parse_package_id(package)
-                    if fnmatch(name, glob):
-                        matches.append(package)
-
-                if not matches:
-                    filtered.missing.append(glob)
-                else:
-                    filtered += matches
-
-            return filtered
-
-        packages = Pool.PackageList(
-            self.kernel.list(all_versions, verbose=verbose)
-        )
+        listing = self.kernel.list(all_versions, verbose=verbose)
         if globs:
-            packages = filter_packages(packages, list(globs))
+            matcher = GlobMatcher(globs)
+            packages = Pool.PackageList(
+                matcher.filter(
+                    listing, key=lambda p: Pool.parse_package_id(p)[0]
+                )
+            )
+            packages.missing = matcher.missing
+        else:
+            packages = Pool.PackageList(listing)
 
         packages.sort(
-            key=(lambda p: debian_support.Version(
-                Pool.parse_package_id(p)[1])
-            ),
+            key=lambda p: version_key(Pool.parse_package_id(p)[1]),
             reverse=True,
         )
         return packages
@@ -1439,6 +3921,7 @@ class Pool:
         tree_fmt: bool = False,
         strict: bool = False,
         source: bool = False,
+        jobs: int | None = None,
     ) -> "Pool.PackageList":
         """get packages to output_dir -> resolved Pool.PackageList of packages
 
@@ -1446,6 +3929,9 @@ class Pool:
         otherwise they are listed in .missing and .failed attrs respectively
         of the returned PackageList
 
+        Up to <jobs> packages are built in parallel (defaults to the pool's
+        jobs, see PoolKernel)
+
         If preserve_buildroot == 'always' then always leave buildroot intact
         after build
 
@@ -1457,34 +3943,49 @@ class Pool:
         """
 
         self.kernel.autosync = False
-        self.kernel.sync()
+        self.kernel.sync_stale()
 
         resolved = Pool.PackageList()
-        unresolved = []
         logger.debug(f"packages = {packages!r}")
-        for package in packages:
-            logger.debug(f"does {package!s} exist?")
-            if not self.kernel.exists(package):
+        resolutions = []
+        for resolution in self.kernel.resolve_many(packages):
+            if resolution.package is None:
                 if strict:
-                    raise PoolError(f"no such package ({package})")
-                resolved.missing.append(package)
+                    raise PoolError(f"no such package ({resolution.request})")
+                resolved.missing.append(resolution.request)
                 continue
-
-            if "=" in package:
-                resolved.append(package)
-            else:
-                unresolved.append(package)
-
-        if unresolved:
-            resolved += self.kernel.resolve(unresolved)
+            resolved.append(resolution.package)
+            resolutions.append(resolution)
 
         try:
-            for package in resolved:
+            self.kernel.touch_many(resolutions)
+            builds = [
+                resolution.package
+                for resolution in resolutions
+                if not resolution.cache_path
+            ]
+            built: dict[str, str] = {}
+            errors: dict[str, str] = {}
+            if builds:
+                built, errors = self.kernel.build_many(
+                    builds, source=source, jobs=jobs, stop_on_error=strict
+                )
+            if strict and errors:
+                raise PoolError(next(iter(errors.values())))
+            for resolution in resolutions:
+                package = resolution.package
+                assert package is not None
                 try:
-                    raw_path_from = self.kernel.getpath_deb(
-                        package, source=source
-                    )
-                    path_from = raw_path_from if raw_path_from else ""
+                    if resolution.cache_path:
+                        path_from = resolution.cache_path
+                    elif package in built:
+                        path_from = built[package]
+                    else:
+                        raise PoolError(
+                            errors.get(
+                                package, f"package `{package}' wasn't built"
+                            )
+                        )
                     fname = basename(path_from)
 
                     if tree_fmt:
@@ -1497,7 +3998,15 @@ class Pool:
                         path_to = join(output_dir, basename(path_from))
 
                     if not exists(path_to):
-                        hardlink_or_copy(path_from, path_to)
+                        deliver = hardlink_or_copy
+                        # path_from is in a pool's .pool/pkgcache
+                        spath = dirname(dirname(path_from))
+                        if islink(join(spath, "store")):
+                            # a hardlink would keep the blob in the store
+                            # (see PackageStore)
+                            deliver = copy_file
+                        strategy = deliver(path_from, path_to)
+                        logger.debug(f"{package}: delivered by {strategy}")
                 except Exception as e:
                     if strict:
                         raise e
@@ -1509,5 +4018,10 @@ class Pool:
 
         return resolved
 
-    def gc(self, recurse: bool = True) -> None:
-        self.kernel.gc(recurse)
+    def gc(
+        self,
+        recurse: bool = True,
+        max_size: int | None = None,
+        max_age: float | None = None,
+    ) -> None:
+        self.kernel.gc(recurse, max_size=max_size, max_age=max_age)
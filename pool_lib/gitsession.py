@@ -0,0 +1,207 @@
+# Copyright (c) TurnKey GNU/Linux - https://www.turnkeylinux.org
+#
+# This file is part of Pool
+#
+# Pool is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+
+"""Long lived git processes for answering many small queries.
+
+Every rev-parse or update-ref through gitwrapper forks a git process. A
+GitSession instead keeps one `git cat-file --batch-check' process for
+resolving revisions and one `git update-ref --stdin' process for updating
+refs per repository, and reuses them until the session is closed.
+
+Close sessions explicitly (GitSessions is a context manager) - their
+processes are left running until then.
+"""
+
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+from collections.abc import Iterable
+from types import TracebackType
+from typing import IO
+
+logger = logging.getLogger("pool.gitsession")
+
+# queries answered and git processes spawned by all sessions - every query
+# beyond a spawn is a process that didn't have to be forked
+stats: dict[str, int] = {"queries": 0, "spawns": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        stats[key] += 1
+
+
+class GitSessionError(Exception):
+    pass
+
+
+class GitSession:
+    """Persistent git processes for the repository at <path>.
+
+    Thread safe. Processes are started on first use and restarted if they
+    die.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self._batch_check: subprocess.Popen | None = None
+        self._update_ref: subprocess.Popen | None = None
+        # process -> file its stderr goes to. Not a pipe: nothing reads it
+        # until the process fails, and a full pipe would block git.
+        self._stderr: dict[subprocess.Popen, IO[str]] = {}
+
+    def __repr__(self) -> str:
+        return f"GitSession({self.path!r})"
+
+    def _spawn(self, *args: str) -> subprocess.Popen:
+        logger.debug(f"{self!r}: spawning git {' '.join(args)}")
+        _count("spawns")
+        stderr = tempfile.TemporaryFile("w+")
+        try:
+            proc = subprocess.Popen(
+                ["git", "-C", self.path, *args],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                text=True,
+            )
+        except BaseException:
+            stderr.close()
+            raise
+        self._stderr[proc] = stderr
+        return proc
+
+    @staticmethod
+    def _alive(proc: subprocess.Popen | None) -> bool:
+        return proc is not None and proc.poll() is None
+
+    def _reap(self, proc: subprocess.Popen) -> str:
+        """close <proc> and return what it had to say on stderr"""
+        assert proc.stdin is not None and proc.stdout is not None
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+        proc.stdout.close()
+        stderr = self._stderr.pop(proc)
+        with stderr:
+            stderr.seek(0)
+            return stderr.read().strip()
+
+    def rev_parse(self, rev: str) -> str | None:
+        """Return the object id <rev> resolves to, or None if it doesn't"""
+        if not rev or "\n" in rev:
+            return None
+
+        with self.lock:
+            _count("queries")
+            if not self._alive(self._batch_check):
+                if self._batch_check is not None:
+                    self._reap(self._batch_check)
+                self._batch_check = self._spawn("cat-file", "--batch-check")
+            proc = self._batch_check
+            assert proc is not None
+            assert proc.stdin is not None and proc.stdout is not None
+            try:
+                proc.stdin.write(f"{rev}\n")
+                proc.stdin.flush()
+            except BrokenPipeError:
+                pass
+            line = proc.stdout.readline()
+            if not line:
+                self._batch_check = None
+                raise GitSessionError(
+                    f"git cat-file died in {self.path}: {self._reap(proc)}"
+                )
+
+        # <oid> <type> <size> or <rev> missing|ambiguous
+        fields = line.split()
+        if len(fields) != 3:
+            return None
+        return fields[0]
+
+    def update_refs(self, commands: Iterable[str]) -> None:
+        """Apply update-ref --stdin <commands> (e.g., "update <ref> <oid>",
+        "delete <ref>") in a single transaction"""
+        lines = [f"{command.rstrip()}\n" for command in commands]
+        if not lines:
+            return
+
+        with self.lock:
+            _count("queries")
+            if not self._alive(self._update_ref):
+                if self._update_ref is not None:
+                    self._reap(self._update_ref)
+                self._update_ref = self._spawn("update-ref", "--stdin")
+            proc = self._update_ref
+            assert proc is not None
+            assert proc.stdin is not None and proc.stdout is not None
+            try:
+                proc.stdin.write("".join(["start\n", *lines, "commit\n"]))
+                proc.stdin.flush()
+            except BrokenPipeError:
+                pass
+            replies = [proc.stdout.readline() for _ in range(2)]
+            if replies != ["start: ok\n", "commit: ok\n"]:
+                # a failed transaction is fatal to update-ref
+                self._update_ref = None
+                raise GitSessionError(
+                    f"failed to update refs in {self.path}:"
+                    f" {self._reap(proc)}"
+                )
+
+    def close(self) -> None:
+        with self.lock:
+            for proc in (self._batch_check, self._update_ref):
+                if proc is not None:
+                    self._reap(proc)
+            self._batch_check = self._update_ref = None
+
+
+class GitSessions:
+    """Registry of GitSessions, one per repository"""
+
+    def __init__(self) -> None:
+        self.sessions: dict[str, GitSession] = {}
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> GitSession:
+        """Return the session for the git repository at <path>"""
+        path = os.path.realpath(path)
+        with self.lock:
+            if path not in self.sessions:
+                self.sessions[path] = GitSession(path)
+            return self.sessions[path]
+
+    def close(self) -> None:
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+        logger.debug(
+            f"git sessions: {stats['queries']} queries with"
+            f" {stats['spawns']} spawns"
+            f" ({stats['queries'] - stats['spawns']} avoided)"
+        )
+
+    def __enter__(self) -> "GitSessions":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""benchmark concurrent autoversion computation within a single stock.
+
+Builds a throwaway git monorepo holding <packages> source packages with
+<commits> commits each, registers it in a fresh pool and times versioning
+all of its source packages with 1, 2, 4, 8 and 16 workers. Every run must
+come up with the same versions as the serial one.
+
+Usage: bench_autoversion.py [packages] [commits]
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pool_lib import Pool, PoolKernel, Stock
+
+
+def git(cwd: str, *args: str) -> None:
+    subprocess.run(
+        ["git", *args], cwd=cwd, check=True, stdout=subprocess.DEVNULL
+    )
+
+
+def make_monorepo(path: str, packages: int, commits: int) -> None:
+    os.makedirs(path)
+    git(path, "init", "-q")
+    git(path, "config", "user.name", "bench")
+    git(path, "config", "user.email", "bench@localhost")
+    for i in range(packages):
+        name = f"package{i:04d}"
+        os.makedirs(os.path.join(path, name, "debian"))
+        with open(os.path.join(path, name, "debian/control"), "w") as fob:
+            fob.write(f"Source: {name}\n\nPackage: {name}\n")
+
+    for commit in range(commits):
+        for i in range(packages):
+            name = f"package{i:04d}"
+            changelog = os.path.join(path, name, "debian/changelog")
+            with open(changelog, "w") as fob:
+                fob.write(f"{name} (1.{commit}) unstable; urgency=low\n")
+        git(path, "add", "-A")
+        git(path, "commit", "-q", "-m", f"commit {commit}")
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    packages = int(args[0]) if args else 200
+    commits = int(args[1]) if len(args) > 1 else 5
+
+    root = tempfile.mkdtemp(prefix="bench-autoversion.")
+    try:
+        monorepo = os.path.join(root, "monorepo")
+        make_monorepo(monorepo, packages, commits)
+
+        path_pool = os.path.join(root, "pool")
+        os.makedirs(path_pool)
+        Pool.init_create(None, path_pool)
+
+        with PoolKernel(path_pool) as kernel:
+            kernel.register(monorepo)
+
+            (stock,) = kernel.stocks
+            assert isinstance(stock, Stock)
+            assert stock.workdir is not None
+            kernel.sync()
+
+            sources: list[str] = []
+            binaries: list[str] = []
+            stock._sync_walk(stock.workdir, sources, binaries)
+            print(f"{len(sources)} source packages, {commits} commits each")
+
+            baseline = None
+            serial = None
+            for jobs in (1, 2, 4, 8, 16):
+                stock.source_versions = {}
+                started = time.monotonic()
+                stock._sync_sources(sources, jobs)
+                elapsed = time.monotonic() - started
+                if baseline is None:
+                    baseline = elapsed
+                    serial = dict(stock.source_versions)
+                elif stock.source_versions != serial:
+                    raise AssertionError(
+                        f"workers={jobs} versions differ from workers=1"
+                    )
+                print(
+                    f"workers={jobs:<3} {elapsed:8.3f}s"
+                    f"  speedup={baseline / elapsed:5.2f}x"
+                )
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
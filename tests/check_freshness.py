@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+"""regression check for the autosync freshness check of plain stocks.
+
+A plain stock directory whose fingerprint couldn't be trusted at the last
+sync - a source package that is a git repository, or one changed right
+before the sync - must never be considered fresh, or autosync would keep
+serving the versions of the last sync.
+
+Usage: check_freshness.py
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+from pool_lib import Pool, PoolKernel, Stock
+
+
+def make_source(path: str, name: str, version: str) -> None:
+    os.makedirs(os.path.join(path, "debian"), exist_ok=True)
+    with open(os.path.join(path, "debian/control"), "w") as fob:
+        fob.write(f"Source: {name}\n\nPackage: {name}\n")
+    with open(os.path.join(path, "debian/changelog"), "w") as fob:
+        fob.write(f"{name} ({version}) unstable; urgency=low\n")
+
+
+def plain_stock(kernel: PoolKernel) -> Stock:
+    (stock,) = kernel.stocks
+    assert isinstance(stock, Stock)
+    return stock
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(prefix="check-freshness.")
+    try:
+        path_stock = os.path.join(root, "stock")
+        make_source(os.path.join(path_stock, "racy"), "racy", "1.0")
+
+        path_pool = os.path.join(root, "pool")
+        os.makedirs(path_pool)
+        Pool.init_create(None, path_pool)
+        kernel = PoolKernel(path_pool)
+        kernel.register(path_stock)
+
+        # synced right after the source was written - fingerprint untrusted
+        kernel.sync()
+        assert not plain_stock(kernel).is_fresh()
+        make_source(os.path.join(path_stock, "racy"), "racy", "2.0")
+        assert "racy=2.0" in PoolKernel(path_pool).list(), "stale racy"
+
+        # a source package that is a git repository is never fingerprinted
+        path_git = os.path.join(path_stock, "gitsrc")
+        make_source(path_git, "gitsrc", "1.0")
+        subprocess.run(["git", "init", "-q", path_git], check=True)
+        kernel = PoolKernel(path_pool)
+        kernel.sync()
+        assert not plain_stock(kernel).is_fresh()
+    finally:
+        shutil.rmtree(root)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()